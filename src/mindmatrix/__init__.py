@@ -3,6 +3,7 @@ from ._mindmatrix import MindMatrix
 from .utils.http_client import AsyncHttpClient, SyncHttpClient
 from .utils.reranker_client import AsyncRerankerClient, RerankerClient
 from .utils.mindmatrix_client import AsyncMindMatrixClient, MindMatrixClient
+from .utils.response_cache import ChatCompletionCache
 from .agent_base import BaseAgent, BaseWorkflow, Artifact, ZhipuAI, OpenAILike, Step, StepInput, StepOutput
 from .knowledge_base import Milvus, OpenAIEmbedder, Document, VectorDbProvider
 from .memory_base import Memory, MindmatrixMemoryManager
@@ -20,6 +21,7 @@ __all__ = [
     "RerankerClient",
     "AsyncMindMatrixClient",
     "MindMatrixClient",
+    "ChatCompletionCache",
     "Document",
     "Milvus",
     "OpenAIEmbedder",
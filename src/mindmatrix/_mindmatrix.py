@@ -1,8 +1,9 @@
+import importlib.util
 import inspect
-import traceback
 from dataclasses import dataclass
 from importlib.metadata import entry_points
-from typing import Union, Callable, List, Dict, Any, Optional
+from types import MappingProxyType
+from typing import Union, Callable, Dict, Any, Mapping, Optional
 
 from loguru import logger
 from fastapi import FastAPI
@@ -22,6 +23,7 @@ from .web import (
     MemoryProvider,
     get_current_workflow,
     set_current_workflow,
+    run_server,
 )
 
 
@@ -53,12 +55,14 @@ class TaskRegistration:
     """A registration of a task with its name and factory."""
     name: str
     task: Task
+    needs_vectordb_provider: bool = False
+    needs_agent_provider: bool = False
 
 
-_plugins: Union[None, List[Any]] = None  # If None, plugins have not been loaded yet.
+_plugins: Union[None, Mapping[str, Any]] = None  # If None, plugins have not been loaded yet.
 
 
-def _load_plugins() -> Union[None, List[Any]]:
+def _load_plugins() -> Union[None, Mapping[str, Any]]:
     """Lazy load plugins, exiting early if already loaded."""
     global _plugins
 
@@ -67,15 +71,16 @@ def _load_plugins() -> Union[None, List[Any]]:
         return _plugins
 
     # Load plugins
-    _plugins = []
+    plugins = {}
     for entry_point in entry_points(group="mindmatrix.plugin"):
         try:
             logger.info(f"load plugin: {entry_point.name}")
-            _plugins.append(entry_point.load())
+            plugins.setdefault(entry_point.name, entry_point.load())
         except Exception:
-            tb = traceback.format_exc()
-            logger.warning(f"Plugin '{entry_point.name}' failed to load ... skipping:\n{tb}")
+            logger.opt(exception=True).warning("Plugin '{}' failed to load ... skipping", entry_point.name)
 
+    # 加载完成后冻结，按名称只读共享
+    _plugins = MappingProxyType(plugins)
     return _plugins
 
 
@@ -101,11 +106,11 @@ class MindMatrix:
         self._embedder = embedder
         self._vectordb = vectordb
 
-        # Register the converters
-        self._agent_factories: List[AgentRegistration] = []
-        self._workflow_factories: List[WorkflowRegistration] = []
-        self._vectordbs: List[VectorDbRegistration] = []
-        self._tasks: List[TaskRegistration] = []
+        # Register the converters, indexed by name
+        self._agent_factories: Dict[str, AgentRegistration] = {}
+        self._workflow_factories: Dict[str, WorkflowRegistration] = {}
+        self._vectordbs: Dict[str, VectorDbRegistration] = {}
+        self._tasks: Dict[str, TaskRegistration] = {}
 
         if (
             enable_builtins is None or enable_builtins
@@ -158,24 +163,23 @@ class MindMatrix:
             # Load plugins
             plugins = _load_plugins()
             assert plugins is not None
-            for plugin in plugins:
+            for name, plugin in plugins.items():
                 try:
                     plugin.register_plugin(self, **kwargs)
                 except Exception:
-                    tb = traceback.format_exc()
-                    logger.warning(f"Plugin '{plugin}' failed to register plugin:\n{tb}")
+                    logger.opt(exception=True).warning("Plugin '{}' failed to register plugin", name)
             self._plugins_enabled = True
         else:
             logger.warning("Plugins are already enabled.")
 
     def has_vectordb(self, vectordb_name: str) -> bool:
-        return any(registration.name == vectordb_name for registration in self._vectordbs)
+        return vectordb_name in self._vectordbs
     
     def has_agent(self, agent_name: str) -> bool:
-        return any(registration.name == agent_name for registration in self._agent_factories)
+        return agent_name in self._agent_factories
     
     def has_workflow(self, workflow_name: str) -> bool:
-        return any(registration.name == workflow_name for registration in self._workflow_factories)
+        return workflow_name in self._workflow_factories
 
     def register_vectordb(
         self,
@@ -185,7 +189,8 @@ class MindMatrix:
         if self.has_vectordb(vectordb_name):
             logger.warning(f"Vector database for {vectordb_name} already registered.")
 
-        self._vectordbs.append(VectorDbRegistration(name=vectordb_name, vector_db=vectordb))
+        # 重复注册时保留先注册的项
+        self._vectordbs.setdefault(vectordb_name, VectorDbRegistration(name=vectordb_name, vector_db=vectordb))
 
     def register_agent_factory(
         self,
@@ -196,8 +201,13 @@ class MindMatrix:
         if self.has_agent(agent_name):
             logger.warning(f"Agent factory for {agent_name} already registered.")
             
-        self._agent_factories.append(
-            AgentRegistration(name=agent_name, agent_factory=agent_factory, agent_config=agent_config)
+        self._agent_factories.setdefault(
+            agent_name,
+            AgentRegistration(
+                name=agent_name,
+                agent_factory=agent_factory,
+                agent_config=agent_config,
+            ),
         )
 
     def register_workflow_factory(
@@ -212,8 +222,13 @@ class MindMatrix:
         if workflow_config is None:
             workflow_config = {}
         
-        self._workflow_factories.append(
-            WorkflowRegistration(name=workflow_name, workflow_factory=workflow_factory, workflow_config=workflow_config)
+        self._workflow_factories.setdefault(
+            workflow_name,
+            WorkflowRegistration(
+                name=workflow_name,
+                workflow_factory=workflow_factory,
+                workflow_config=workflow_config,
+            ),
         )
 
     def register_task(
@@ -221,45 +236,58 @@ class MindMatrix:
         task_name: str,
         task: Task,
     ) -> None:
-        self._tasks.append(TaskRegistration(name=task_name, task=task))
+        # 注册时解析一次函数签名，运行任务时不再调用 inspect
+        params = inspect.signature(task.fn).parameters
+        self._tasks.setdefault(
+            task_name,
+            TaskRegistration(
+                name=task_name,
+                task=task,
+                needs_vectordb_provider='vectordb_provider' in params,
+                needs_agent_provider='agent_provider' in params,
+            ),
+        )
 
     def get_vectordb(
         self,
         vectordb_name: str,
     ) -> VectorDb:
-        for registration in self._vectordbs:
-            if registration.name == vectordb_name:
-                return registration.vector_db
-        raise ValueError(f"Vector database for {registration.name} not found")
+        registration = self._vectordbs.get(vectordb_name)
+        if registration is None:
+            raise ValueError(f"Vector database for {vectordb_name} not found")
+        return registration.vector_db
 
     def get_agent(
         self,
         agent_name: str,
         **kwargs,
     ) -> Agent:
-        for registration in self._agent_factories:
-            if registration.name == agent_name:
-                return registration.agent_factory(self, **registration.agent_config, **kwargs) # TODO: 动态注入
-        raise ValueError(f"Agent factory for {agent_name} not found")
+        registration = self._agent_factories.get(agent_name)
+        if registration is None:
+            raise ValueError(f"Agent factory for {agent_name} not found")
+        return registration.agent_factory(self, **registration.agent_config, **kwargs) # TODO: 动态注入
     
     def get_workflow(
         self,
         workflow_name: str,
         **kwargs,
     ) -> Workflow:
-        for registration in self._workflow_factories:
-            if registration.name == workflow_name:
-                return registration.workflow_factory(self, **registration.workflow_config, **kwargs) # TODO: 动态注入
-        raise ValueError(f"Workflow factory for {workflow_name} not found")
+        registration = self._workflow_factories.get(workflow_name)
+        if registration is None:
+            raise ValueError(f"Workflow factory for {workflow_name} not found")
+        return registration.workflow_factory(self, **registration.workflow_config, **kwargs) # TODO: 动态注入
 
     def get_task(
         self,
         task_name: str,
     ) -> Task:
-        for registration in self._tasks:
-            if registration.name == task_name:
-                return registration.task
-        raise ValueError(f"Task for {task_name} not found")
+        return self._get_task_registration(task_name).task
+
+    def _get_task_registration(self, task_name: str) -> TaskRegistration:
+        registration = self._tasks.get(task_name)
+        if registration is None:
+            raise ValueError(f"Task for {task_name} not found")
+        return registration
     
     # @flow
     async def async_run_task(
@@ -268,19 +296,17 @@ class MindMatrix:
         *args,
         **kwargs,
     ) -> Any:
-        task = self.get_task(task_name)
+        registration = self._get_task_registration(task_name)
         logger.debug(f"* Running task: {task_name}")
-        # 获取task函数的参数信息
-        sig = inspect.signature(task.fn)
         
-        # 检查参数中是否包含vectordb_provider
-        if 'vectordb_provider' in sig.parameters:
+        # 按注册时解析的参数信息注入 provider
+        if registration.needs_vectordb_provider:
             kwargs['vectordb_provider'] = VectorDbProvider(self)
 
-        if 'agent_provider' in sig.parameters:
+        if registration.needs_agent_provider:
             kwargs['agent_provider'] = AgentProvider(self)
         
-        return await task.fn(*args, **kwargs)
+        return await registration.task.fn(*args, **kwargs)
 
     def start_web_server(
         self,
@@ -289,9 +315,8 @@ class MindMatrix:
         log_level: str = "debug",
         **kwargs,
     ) -> None:
-        try:
-            import uvicorn
-        except ImportError:
+        # 只检查 uvicorn 是否可用，由 run_server 负责导入
+        if importlib.util.find_spec("uvicorn") is None:
             logger.error("uvicorn 未安装，请运行: pip install uvicorn")
             return
 
@@ -301,7 +326,7 @@ class MindMatrix:
         logger.info(f"交互式文档: http://{host}:{port}/redoc")
         
         try:
-            uvicorn.run(self.app, host=host, port=port, log_level=log_level, **kwargs)
+            run_server(self.app, host=host, port=port, log_level=log_level, **kwargs)
         except KeyboardInterrupt:
             logger.info("服务器已停止")
         except Exception as e:
@@ -1,4 +1,5 @@
 import asyncio
+import weakref
 from dataclasses import dataclass
 from typing import (
     Any,
@@ -10,7 +11,8 @@ from typing import (
     cast,
 )
 
-from pydantic import BaseModel, Field
+import orjson
+from pydantic import BaseModel, Field, TypeAdapter
 from agno.media import Media
 from agno.agent import Agent
 from agno.models.base import Model
@@ -23,6 +25,30 @@ from agno.utils.log import (
     logger,
 )
 
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+# 限制同时执行的后台记忆更新数量；信号量按事件循环分别创建，避免跨循环复用
+_MAX_BACKGROUND_MEMORY_UPDATES = 32
+_background_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_background_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _background_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _background_semaphores[loop] = asyncio.Semaphore(_MAX_BACKGROUND_MEMORY_UPDATES)
+    return semaphore
+
+
+# 将参考文档（含 Pydantic 模型）一次性转换为可序列化的结构
+_DOCS_ADAPTER = TypeAdapter(List[Any])
+
 
 class Artifact(Media):
     ...
@@ -32,30 +58,22 @@ class Artifact(Media):
 class BaseAgent(Agent):
 
     def convert_documents_to_string(self, docs: List[Any]) -> str:
-        if docs is None or len(docs) == 0:
+        if not docs:
             return ""
 
-        # 递归将所有 Pydantic BaseModel 转为 dict
-        def to_dict(obj):
-            if hasattr(obj, "model_dump"):  # Pydantic v2
-                return obj.model_dump()
-            elif hasattr(obj, "dict"):      # Pydantic v1
-                return obj.dict()
-            elif isinstance(obj, list):
-                return [to_dict(i) for i in obj]
-            elif isinstance(obj, dict):
-                return {k: to_dict(v) for k, v in obj.items()}
-            else:
-                return obj
-
-        docs_dict = to_dict(docs)
+        if len(docs) == 1 and isinstance(docs[0], BaseModel):
+            # 常见的单条参考文档直接由模型自身序列化，不经过 TypeAdapter
+            docs_dict = [docs[0].model_dump(mode="json")]
+        else:
+            # 由 pydantic-core 递归将所有 Pydantic BaseModel 转为 dict
+            docs_dict = _DOCS_ADAPTER.dump_python(docs, mode="json")
 
         if getattr(self, "references_format", None) == "yaml":
-            import yaml
+            if yaml is None:
+                raise ImportError("`pyyaml` not installed, please install it with: pip install pyyaml")
             return yaml.dump(docs_dict, allow_unicode=True)
 
-        import json
-        return json.dumps(docs_dict, indent=2, ensure_ascii=False)
+        return orjson.dumps(docs_dict, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
 
     async def _aupdate_memory_background(
         self,
@@ -65,32 +83,29 @@ class BaseAgent(Agent):
     ) -> None:
         """后台异步更新内存，不阻塞主流程"""
         try:
-            async for _ in self._aupdate_memory(
-                run_messages=run_messages,
-                session_id=session_id,
-                user_id=user_id,
-            ):
-                pass
+            async with _get_background_semaphore():
+                async for _ in self._aupdate_memory(
+                    run_messages=run_messages,
+                    session_id=session_id,
+                    user_id=user_id,
+                ):
+                    pass
         except Exception as e:
             logger.error(f"后台内存更新失败: {e}")
             # 不抛出异常，避免影响主流程
     
 
-@dataclass(init=False)
 class BaseWorkflow(WorkflowV2):
     pass
 
 
-@dataclass(init=False)
 class Step(StepV2):
     pass
 
 
-@dataclass
 class StepInput(StepInputV2):
     pass
 
 
-@dataclass
 class StepOutput(StepOutputV2):
     pass
@@ -2,7 +2,6 @@ from dataclasses import dataclass
 from agno.models.openai.like import OpenAILike as OpenAILike_
 
 
-@dataclass
 class OpenAILike(OpenAILike_):
     ...
 
@@ -1,5 +1,8 @@
+import asyncio
+import threading
 from dataclasses import dataclass
-from typing import Optional, List, Dict, Any, Literal
+from hashlib import md5
+from typing import Optional, List, Dict, Any, Literal, Tuple, Union
 
 from loguru import logger
 from agno.reranker.base import Reranker
@@ -7,9 +10,9 @@ from agno.vectordb.search import SearchType
 from agno.document import Document as Document_
 from agno.vectordb.milvus import Milvus as Milvus_
 from agno.embedder.openai import OpenAIEmbedder as OpenAIEmbedder_
+from openai.types.create_embedding_response import CreateEmbeddingResponse
 
 
-@dataclass
 class Document(Document_):
     ...
 
@@ -18,8 +21,36 @@ class Document(Document_):
 class OpenAIEmbedder(OpenAIEmbedder_):
     dimensions: int = 1024
 
+    def response(self, text: Union[str, List[str]]) -> CreateEmbeddingResponse:
+        """请求 embeddings 接口，input 可以是单条文本或文本列表"""
+        _request_params: Dict[str, Any] = {
+            "input": text,
+            "model": self.id,
+            "encoding_format": self.encoding_format,
+        }
+        if self.user is not None:
+            _request_params["user"] = self.user
+        if self.id.startswith("text-embedding-3"):
+            _request_params["dimensions"] = self.dimensions
+        if self.request_params:
+            _request_params.update(self.request_params)
+        return self.client.embeddings.create(**_request_params)
+
+    def get_embeddings_and_usage(self, texts: List[str]) -> Tuple[List[List[float]], Optional[Dict]]:
+        """
+        一次请求向量化多条文本
+
+        Returns:
+            (embeddings, usage)，embeddings 与 texts 顺序一致；usage 为整批请求的用量
+        """
+        response = self.response(text=texts)
+        embeddings: List[List[float]] = [[] for _ in texts]
+        for item in response.data:
+            embeddings[item.index] = item.embedding
+        usage = response.usage.model_dump() if response.usage else None
+        return embeddings, usage
+
 
-@dataclass
 class VectorDb:
     ...
 
@@ -43,6 +74,7 @@ class Milvus(VectorDb):
         search_type: SearchType = SearchType.vector, 
         reranker: Optional[Reranker] = None, 
         sparse_vector_dimensions: int = 10000, 
+        embed_batch_size: int = 32,
         **kwargs
     ):
         self._embedder = embedder
@@ -51,11 +83,16 @@ class Milvus(VectorDb):
         self._search_type = search_type
         self._reranker = reranker
         self._sparse_vector_dimensions = sparse_vector_dimensions
+        # 批量写入时每次请求 embedder 的文本数，与写入 Milvus 的批次大小相互独立
+        self._embed_batch_size = embed_batch_size
         self._kwargs = kwargs
+        # 按集合缓存已创建（create）的客户端，首次使用时初始化
+        self._clients: Dict[str, Milvus_] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._sync_lock = threading.Lock()
 
-    def _get_client(self, collection: str) -> Milvus_:
-        logger.debug(f"get client for collection: {collection}")
-        client = Milvus_(
+    def _new_client(self, collection: str) -> Milvus_:
+        return Milvus_(
             collection=collection,
             embedder=self._embedder,
             uri=self._uri,
@@ -65,23 +102,39 @@ class Milvus(VectorDb):
             sparse_vector_dimensions=self._sparse_vector_dimensions,
             **self._kwargs,
         )
-        client.create()
+
+    def _get_client(self, collection: str) -> Milvus_:
+        client = self._clients.get(collection)
+        if client is not None:
+            return client
+        with self._sync_lock:
+            client = self._clients.get(collection)
+            if client is None:
+                logger.debug("create client for collection: {}", collection)
+                client = self._new_client(collection)
+                client.create()
+                client = self._clients.setdefault(collection, client)
         return client
 
     async def _async_get_client(self, collection: str) -> Milvus_:
-        logger.debug(f"get client for collection: {collection}")
-        client = Milvus_(
-            collection=collection,
-            embedder=self._embedder,
-            uri=self._uri,
-            token=self._token,
-            search_type=self._search_type,
-            reranker=self._reranker,
-            sparse_vector_dimensions=self._sparse_vector_dimensions,
-            **self._kwargs,
-        )
-        await client.async_create()
+        client = self._clients.get(collection)
+        if client is not None:
+            return client
+        lock = self._locks.setdefault(collection, asyncio.Lock())
+        async with lock:
+            client = self._clients.get(collection)
+            if client is None:
+                logger.debug("create client for collection: {}", collection)
+                client = self._new_client(collection)
+                await client.async_create()
+                client = self._clients.setdefault(collection, client)
         return client
+
+    def _evict_client(self, collection: str, client: Milvus_) -> None:
+        """操作失败时移除缓存的客户端，下次调用重新连接"""
+        if self._clients.get(collection) is client:
+            logger.warning(f"evict client for collection: {collection}")
+            del self._clients[collection]
     
     def insert(
         self, 
@@ -89,15 +142,58 @@ class Milvus(VectorDb):
         documents: List[Document], 
         filters: Optional[Dict[str, Any]] = None
     ) -> None:
-        self._get_client(collection).insert(documents, filters)
+        if not documents:
+            return
+        client = self._get_client(collection)
+        try:
+            client.insert(documents, filters)
+        except Exception:
+            self._evict_client(collection, client)
+            raise
 
     async def async_insert(
         self, 
         collection: str, 
         documents: List[Document], 
-        filters: Optional[Dict[str, Any]] = None
+        filters: Optional[Dict[str, Any]] = None,
+        batch_size: int = 100,
+        concurrency: int = 8,
     ) -> None:
-        await self._async_get_client(collection).async_insert(documents, filters)
+        """
+        分批写入文档，批次之间并发执行；与 agno 一致，filters 会合并到每个文档的 meta_data
+
+        Args:
+            batch_size: 每批写入的文档数
+            concurrency: 同时写入的最大批次数
+        """
+        if not documents:
+            return
+        logger.debug(
+            "async insert {} to collection[{}] with batch_size={}, concurrency={}",
+            len(documents), collection, batch_size, concurrency,
+        )
+        client = await self._async_get_client(collection)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def insert_batch(i: int) -> None:
+            batch = documents[i:i + batch_size]
+            async with semaphore:
+                if self._search_type == SearchType.vector:
+                    # 整批文档批量向量化、一次写入
+                    await self._embed_documents(batch)
+                    await client.async_client.insert(
+                        collection_name=collection,
+                        data=[self._document_row(doc, filters) for doc in batch],
+                    )
+                else:
+                    # agno 的写入会同步调用 embedder，放到线程中执行以免阻塞事件循环
+                    await asyncio.to_thread(client.insert, batch, filters)
+
+        try:
+            await asyncio.gather(*(insert_batch(i) for i in range(0, len(documents), batch_size)))
+        except Exception:
+            self._evict_client(collection, client)
+            raise
 
     def upsert(
         self, 
@@ -105,23 +201,103 @@ class Milvus(VectorDb):
         documents: List[Document], 
         filters: Optional[Dict[str, Any]] = None
     ) -> None:
-        self._get_client(collection).upsert(documents, filters)
+        if not documents:
+            return
+        client = self._get_client(collection)
+        try:
+            client.upsert(documents, filters)
+        except Exception:
+            self._evict_client(collection, client)
+            raise
     
     async def async_upsert(
         self, 
         collection: str, 
         documents: List[Document], 
         filters: Optional[Dict[str, Any]] = None,
-        batch_size: int = 100
+        batch_size: int = 100,
+        concurrency: int = 8,
     ) -> None:
-        logger.debug(f"async upsert {len(documents)} to collection[{collection}] with batch_size={batch_size}")
+        """
+        分批写入文档，批次之间并发执行
+
+        Args:
+            batch_size: 每批写入的文档数
+            concurrency: 同时写入的最大批次数
+        """
+        if not documents:
+            return
+        # 日志参数由 loguru 延迟格式化，未启用 DEBUG 时不产生格式化开销
+        logger.debug(
+            "async upsert {} to collection[{}] with batch_size={}, concurrency={}",
+            len(documents), collection, batch_size, concurrency,
+        )
         client = await self._async_get_client(collection)
-        
-        # 批量处理 documents
-        for i in range(0, len(documents), batch_size):
+        semaphore = asyncio.Semaphore(concurrency)
+        total = (len(documents) + batch_size - 1) // batch_size
+
+        async def upsert_batch(i: int) -> None:
             batch = documents[i:i + batch_size]
-            logger.debug(f"processing batch {i//batch_size + 1}/{(len(documents) + batch_size - 1)//batch_size} with {len(batch)} documents")
-            await client.async_upsert(batch, filters)
+            async with semaphore:
+                logger.debug("processing batch {}/{} with {} documents", i // batch_size + 1, total, len(batch))
+                if self._search_type == SearchType.vector:
+                    # 整批文档一次向量化、一次写入，代替逐个文档请求 embedder 与 Milvus
+                    await self._embed_documents(batch)
+                    await client.async_client.upsert(
+                        collection_name=collection,
+                        data=[self._document_row(doc) for doc in batch],
+                    )
+                else:
+                    # agno 的写入会同步调用 embedder，放到线程中执行以免阻塞事件循环
+                    await asyncio.to_thread(client.upsert, batch, filters)
+
+        # 批量处理 documents
+        try:
+            await asyncio.gather(*(upsert_batch(i) for i in range(0, len(documents), batch_size)))
+        except Exception:
+            self._evict_client(collection, client)
+            raise
+
+    async def _embed_documents(self, documents: List[Document]) -> None:
+        """
+        向量化文档，结果写回 `document.embedding` 与 `document.usage`
+
+        embedder 支持批量接口时按 `embed_batch_size` 分批请求，每个文档的 usage 记录其所在请求的用量
+        （附带 `batch_size`）；否则回退为 agno 的逐个文档 `Document.embed`。
+        """
+        embedder = self._embedder
+        if not isinstance(embedder, OpenAIEmbedder):
+            for doc in documents:
+                await asyncio.to_thread(doc.embed, embedder)
+            return
+
+        size = self._embed_batch_size
+        for i in range(0, len(documents), size):
+            batch = documents[i:i + size]
+            embeddings, usage = await asyncio.to_thread(
+                embedder.get_embeddings_and_usage, [doc.content for doc in batch]
+            )
+            batch_usage = {**usage, "batch_size": len(batch)} if usage else None
+            for doc, embedding in zip(batch, embeddings):
+                doc.embedding = embedding
+                doc.usage = batch_usage
+
+    @staticmethod
+    def _document_row(document: Document, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """与 agno Milvus 写入的行格式保持一致；传入 filters 时与 agno 的 insert 相同，合并到 meta_data"""
+        cleaned_content = document.content.replace("\x00", "\ufffd")
+        meta_data = document.meta_data
+        if filters:
+            meta_data = document.meta_data or {}
+            meta_data.update(filters)
+        return {
+            "id": md5(cleaned_content.encode()).hexdigest(),
+            "vector": document.embedding,
+            "name": document.name,
+            "meta_data": meta_data,
+            "content": cleaned_content,
+            "usage": document.usage,
+        }
 
     async def async_search(
         self,
@@ -130,6 +306,10 @@ class Milvus(VectorDb):
         limit: int = 5, 
         filters: Optional[Dict[str, Any]] = None,
     ) -> List[Document]:
-        logger.debug(f"async search query: {query} on collection[{collection}]")
+        logger.debug("async search query: {} on collection[{}]", query, collection)
         client = await self._async_get_client(collection)
-        return await client.async_search(query, limit, filters)
+        try:
+            return await client.async_search(query, limit, filters)
+        except Exception:
+            self._evict_client(collection, client)
+            raise
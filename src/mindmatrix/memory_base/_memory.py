@@ -1,4 +1,6 @@
-from typing import Optional, List
+import heapq
+import itertools
+from typing import Any, Callable, Optional, List
 
 from agno.memory.v2.memory import UserMemory
 from agno.memory.v2 import Memory as Memory_
@@ -7,20 +9,38 @@ from agno.memory.v2 import Memory as Memory_
 class Memory(Memory_):
 
     def __init__(
-        self, 
-        *args, 
+        self,
+        *args,
         exclude_topics: Optional[List[str]] = None,
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
         self.exclude_topics = exclude_topics
-    
+
+    @property
+    def exclude_topics(self) -> Optional[List[str]]:
+        return self._exclude_topics
+
+    @exclude_topics.setter
+    def exclude_topics(self, exclude_topics: Optional[List[str]]) -> None:
+        self._exclude_topics = exclude_topics
+        self._exclude_set = frozenset(exclude_topics or ())
+
     def get_user_memories(
-        self, 
-        user_id: Optional[str] = None, 
-        refresh_from_db: bool = True, 
+        self,
+        user_id: Optional[str] = None,
+        refresh_from_db: bool = True,
+        limit: Optional[int] = None,
+        key: Optional[Callable[[UserMemory], Any]] = None,
     ) -> List[UserMemory]:
-        """Get the user memories for a given user id"""
+        """Get the user memories for a given user id
+
+        Args:
+            user_id: 用户ID
+            refresh_from_db: 是否先从数据库刷新
+            limit: 最多返回的记忆条数，为 None 时返回全部
+            key: 排序函数，按其返回值从大到小返回记忆（如按 last_updated 优先返回最近的记忆）
+        """
         if user_id is None:
             user_id = "default"
         # Refresh from the DB
@@ -29,7 +49,15 @@ class Memory(Memory_):
 
         if self.memories is None:
             return []
-        memories = list(self.memories.get(user_id, {}).values())
-        if self.exclude_topics:
-            memories = [memory for memory in memories if not any(topic in self.exclude_topics for topic in memory.topics)]
-        return memories
\ No newline at end of file
+        memories = self.memories.get(user_id, {}).values()
+        if self._exclude_set:
+            exclude_set = self._exclude_set
+            memories = (memory for memory in memories if exclude_set.isdisjoint(memory.topics or ()))
+
+        if key is not None:
+            if limit is not None:
+                return heapq.nlargest(limit, memories, key=key)
+            return sorted(memories, key=key, reverse=True)
+        if limit is not None:
+            return list(itertools.islice(memories, limit))
+        return list(memories)
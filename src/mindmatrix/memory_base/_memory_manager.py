@@ -1,5 +1,7 @@
-from dataclasses import dataclass
-from typing import Any, Callable, Dict, List, Optional
+import hashlib
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from textwrap import dedent
 from agno.agent import Agent
@@ -8,9 +10,74 @@ from agno.memory.v2.db import MemoryDb
 from agno.memory.v2.manager import MemoryManager
 
 
+def add_memory(memory: str, topics: Optional[List[str]] = None) -> str:
+    """Use this function to add a memory to the database.
+    Args:
+        memory (str): The memory to be added.
+        topics (Optional[List[str]]): The topics of the memory (e.g. ["name", "hobbies", "location"]).
+    Returns:
+        str: A message indicating if the memory was added successfully or not.
+    """
+    return "Memory added successfully"
+
+
+def update_memory(memory_id: str, memory: str, topics: Optional[List[str]] = None) -> str:
+    """Use this function to update an existing memory in the database.
+    Args:
+        memory_id (str): The id of the memory to be updated.
+        memory (str): The updated memory.
+        topics (Optional[List[str]]): The topics of the memory (e.g. ["name", "hobbies", "location"]).
+    Returns:
+        str: A message indicating if the memory was updated successfully or not.
+    """
+    return "Memory updated successfully"
+
+
+def delete_memory(memory_id: str) -> str:
+    """Use this function to delete a single memory from the database.
+    Args:
+        memory_id (str): The id of the memory to be deleted.
+    Returns:
+        str: A message indicating if the memory was deleted successfully or not.
+    """
+    return "Memory deleted successfully"
+
+
+def clear_memory() -> str:
+    """Use this function to remove all (or clear all) memories from the database.
+
+    Returns:
+        str: A message indicating if the memory was cleared successfully or not.
+    """
+    return "Memory cleared successfully"
+
+
+@lru_cache(maxsize=16)
+def _get_fake_db_tools(
+    enable_add_memory: bool,
+    enable_update_memory: bool,
+    enable_delete_memory: bool,
+    enable_clear_memory: bool,
+) -> Tuple[Callable, ...]:
+    """记忆管理工具只用于生成工具描述，不会真正执行，因此按开关组合缓存"""
+    functions: List[Callable] = []
+    if enable_add_memory:
+        functions.append(add_memory)
+    if enable_update_memory:
+        functions.append(update_memory)
+    if enable_delete_memory:
+        functions.append(delete_memory)
+    if enable_clear_memory:
+        functions.append(clear_memory)
+    return tuple(functions)
+
+
 @dataclass
 class MindmatrixMemoryManager(MemoryManager):
 
+    # 上一次生成的记忆块 (排序后的 (memory_id, memory) 元组, text)
+    _last_pack: Optional[Tuple[Tuple[Tuple[str, str], ...], str]] = field(default=None, init=False, repr=False)
+
     def get_system_message(
         self,
         existing_memories: Optional[List[Dict[str, Any]]] = None,
@@ -82,18 +149,38 @@ class MindmatrixMemoryManager(MemoryManager):
         ]
 
         if existing_memories and len(existing_memories) > 0:
-            system_prompt_lines.append("\n<existing_memories>")
-            for existing_memory in existing_memories:
-                system_prompt_lines.append(f"ID: {existing_memory['memory_id']}")
-                system_prompt_lines.append(f"Memory: {existing_memory['memory']}")
-                system_prompt_lines.append("")
-            system_prompt_lines.append("</existing_memories>")
+            system_prompt_lines.append(self._get_memory_pack(existing_memories))
 
         if self.additional_instructions:
             system_prompt_lines.append(self.additional_instructions)
 
         return Message(role="system", content="\n".join(system_prompt_lines))
     
+    def _get_memory_pack(self, existing_memories: List[Dict[str, Any]]) -> str:
+        """按 memory_id 排序生成带版本号的 <existing_memories> 块
+
+        相同的记忆集合总是生成完全一致的文本，便于模型服务端的前缀缓存命中；
+        版本号未变化时直接复用上一次生成的文本。
+        """
+        memories = sorted(existing_memories, key=lambda m: str(m["memory_id"]))
+        # 复用判断比较完整的记忆内容；短版本号只用于提示词中的 version 属性
+        key = tuple((str(m["memory_id"]), str(m["memory"])) for m in memories)
+        if self._last_pack is not None and self._last_pack[0] == key:
+            return self._last_pack[1]
+        version = hashlib.md5(
+            b"\n".join(f"{m['memory_id']}:{m['memory']}".encode("utf-8") for m in memories)
+        ).hexdigest()[:8]
+
+        lines = [f'\n<existing_memories version="{version}">']
+        for memory in memories:
+            lines.append(f"ID: {memory['memory_id']}")
+            lines.append(f"Memory: {memory['memory']}")
+            lines.append("")
+        lines.append("</existing_memories>")
+        text = "\n".join(lines)
+        self._last_pack = (key, text)
+        return text
+
     def build_agent(
         self,
         messages: Optional[List[Message]] = None,
@@ -125,52 +212,11 @@ class MindmatrixMemoryManager(MemoryManager):
         enable_delete_memory: bool = True,
         enable_clear_memory: bool = True,
     ) -> List[Callable]:
-
-        def add_memory(memory: str, topics: Optional[List[str]] = None) -> str:
-            """Use this function to add a memory to the database.
-            Args:
-                memory (str): The memory to be added.
-                topics (Optional[List[str]]): The topics of the memory (e.g. ["name", "hobbies", "location"]).
-            Returns:
-                str: A message indicating if the memory was added successfully or not.
-            """
-            return "Memory added successfully"
-
-        def update_memory(memory_id: str, memory: str, topics: Optional[List[str]] = None) -> str:
-            """Use this function to update an existing memory in the database.
-            Args:
-                memory_id (str): The id of the memory to be updated.
-                memory (str): The updated memory.
-                topics (Optional[List[str]]): The topics of the memory (e.g. ["name", "hobbies", "location"]).
-            Returns:
-                str: A message indicating if the memory was updated successfully or not.
-            """
-            return "Memory updated successfully"
-
-        def delete_memory(memory_id: str) -> str:
-            """Use this function to delete a single memory from the database.
-            Args:
-                memory_id (str): The id of the memory to be deleted.
-            Returns:
-                str: A message indicating if the memory was deleted successfully or not.
-            """
-            return "Memory deleted successfully"
-
-        def clear_memory() -> str:
-            """Use this function to remove all (or clear all) memories from the database.
-
-            Returns:
-                str: A message indicating if the memory was cleared successfully or not.
-            """
-            return "Memory cleared successfully"
-
-        functions: List[Callable] = []
-        if enable_add_memory:
-            functions.append(add_memory)
-        if enable_update_memory:
-            functions.append(update_memory)
-        if enable_delete_memory:
-            functions.append(delete_memory)
-        if enable_clear_memory:
-            functions.append(clear_memory)
-        return functions
\ No newline at end of file
+        return list(
+            _get_fake_db_tools(
+                enable_add_memory,
+                enable_update_memory,
+                enable_delete_memory,
+                enable_clear_memory,
+            )
+        )
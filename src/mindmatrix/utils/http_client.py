@@ -1,14 +1,73 @@
+import time
+from urllib.parse import urljoin
+
 import httpx
+import orjson
 from loguru import logger
-from urllib.parse import urljoin
+
+from .http_pool import DEFAULT_LIMITS, get_async_client, get_sync_client
+
+
+def _build_url(base_url, path):
+    """拼接 base_url 与 path，保留 base_url 中的路径前缀（如 /v1）"""
+    if base_url:
+        return urljoin(base_url.rstrip('/') + '/', path.lstrip('/'))
+    return path
+
+
+def _dumps_json(obj) -> bytes:
+    """将请求体序列化为 JSON bytes"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _loads_json(content: bytes):
+    """解析 JSON 响应体"""
+    return orjson.loads(content)
+
+
+def _json_kwargs(json, kwargs, default_headers=None) -> dict:
+    """预先序列化 JSON 请求体，替代 httpx 的 `json=` 参数"""
+    headers = kwargs.pop("headers", default_headers)
+    # 已声明 JSON 类型的请求头（如实例的 headers）直接复用，不再复制
+    if headers is None or headers.get("Content-Type") != "application/json":
+        headers = httpx.Headers(headers)
+        headers["Content-Type"] = "application/json"
+    return {"content": _dumps_json(json), "headers": headers}
+
+
+def _request_kwargs(client, kwargs) -> dict:
+    """共享连接池不携带实例级配置，按请求合并实例的 headers 与 timeout"""
+    headers = kwargs.get("headers")
+    if headers is None:
+        kwargs["headers"] = client.headers
+    elif headers is not client.headers:
+        merged = httpx.Headers(client.headers)
+        merged.update(headers)
+        kwargs["headers"] = merged
+    kwargs.setdefault("timeout", client.timeout)
+    return kwargs
 
 
 class AsyncHttpClient:
-    def __init__(self, base_url=None, headers=None, timeout=10):
+    def __init__(self, base_url=None, headers=None, timeout=10, http2=True, limits=DEFAULT_LIMITS):
         self.base_url = base_url
-        self.headers = headers or {}
+        self.headers = httpx.Headers(headers)
         self.timeout = timeout
-        self.client = httpx.AsyncClient(base_url=base_url, headers=self.headers, timeout=self.timeout)
+        self.http2 = http2
+        self.limits = limits
+        self._client = None
+        self._connected_at = -float("inf")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """默认借用共享连接池，也可以赋值为自有的 httpx.AsyncClient"""
+        if self._client is not None:
+            return self._client
+        return get_async_client(http2=self.http2, limits=self.limits)
+
+    @client.setter
+    def client(self, client: httpx.AsyncClient):
+        self._client = client
 
     async def __aenter__(self):
         return self
@@ -17,16 +76,14 @@ class AsyncHttpClient:
         await self._close()
 
     def _build_url(self, path):
-        if self.base_url:
-            return urljoin(self.base_url.rstrip('/') + '/', path.lstrip('/'))
-        return path
+        return _build_url(self.base_url, path)
 
     async def _request(self, method, url, **kwargs):
         try:
-            response = await self.client.request(method, url, **kwargs)
+            response = await self.client.request(method, url, **_request_kwargs(self, kwargs))
             response.raise_for_status()
             try:
-                return {"status": response.status_code, "data": response.json()}
+                return {"status": response.status_code, "data": _loads_json(response.content)}
             except Exception:
                 return {"status": response.status_code, "data": response.text}
         except httpx.HTTPStatusError as exc:
@@ -41,7 +98,34 @@ class AsyncHttpClient:
 
     async def _post(self, path, data=None, json=None, **kwargs):
         url = self._build_url(path)
-        return await self._request("POST", url, data=data, json=json, **kwargs)
+        if json is not None and data is None:
+            kwargs.update(_json_kwargs(json, kwargs, self.headers))
+        return await self._request("POST", url, data=data, **kwargs)
+
+    async def _post_stream_json(self, path, json=None, **kwargs):
+        """
+        以流式方式读取响应体的 POST 请求，返回结构与 `_post` 一致
+
+        响应体分块写入同一个缓冲区后直接解析，适用于响应较大的接口（如非流式的聊天接口）。
+        """
+        url = self._build_url(path)
+        if json is not None:
+            kwargs.update(_json_kwargs(json, kwargs, self.headers))
+        try:
+            async with self.client.stream("POST", url, **_request_kwargs(self, kwargs)) as response:
+                response.raise_for_status()
+                body = bytearray()
+                async for chunk in response.aiter_bytes():
+                    body += chunk
+        except httpx.HTTPStatusError as exc:
+            return {"status": exc.response.status_code, "error": str(exc)}
+        except httpx.RequestError as exc:
+            return {"status": None, "error": str(exc)}
+
+        try:
+            return {"status": response.status_code, "data": _loads_json(body)}
+        except Exception:
+            return {"status": response.status_code, "data": body.decode(response.encoding or "utf-8", errors="replace")}
 
     async def _put(self, path, data=None, **kwargs):
         url = self._build_url(path)
@@ -51,16 +135,54 @@ class AsyncHttpClient:
         url = self._build_url(path)
         return await self._request("DELETE", url, **kwargs)
 
+    async def ensure_connected(self) -> bool:
+        """
+        预热到 base_url 的连接（HEAD 请求），忽略响应状态与错误
+
+        在 keep-alive 有效期内已预热过时直接返回，可与其他耗时操作并发执行，
+        让后续请求复用已建立的连接。
+
+        Returns:
+            连接是否可用
+        """
+        if not self.base_url:
+            return False
+        expiry = self.limits.keepalive_expiry or 0
+        if time.monotonic() - self._connected_at < expiry:
+            return True
+        try:
+            await self.client.head(self.base_url, headers=self.headers, timeout=self.timeout)
+        except httpx.HTTPError as exc:
+            logger.warning(f"failed to warm up connection to {self.base_url}: {exc}")
+            return False
+        self._connected_at = time.monotonic()
+        return True
+
     async def _close(self):
-        await self.client.aclose()
+        # 共享连接池随事件循环 / 进程存续，供所有实例复用，不在这里关闭；只关闭实例自有的客户端
+        if self._client is not None:
+            await self._client.aclose()
 
 
 class SyncHttpClient:
-    def __init__(self, base_url=None, headers=None, timeout=10):
+    def __init__(self, base_url=None, headers=None, timeout=10, http2=True, limits=DEFAULT_LIMITS):
         self.base_url = base_url
-        self.headers = headers or {}
+        self.headers = httpx.Headers(headers)
         self.timeout = timeout
-        self.client = httpx.Client(base_url=base_url, headers=self.headers, timeout=self.timeout)
+        self.http2 = http2
+        self.limits = limits
+        self._client = None
+
+    @property
+    def client(self) -> httpx.Client:
+        """默认借用共享连接池，也可以赋值为自有的 httpx.Client"""
+        if self._client is not None:
+            return self._client
+        return get_sync_client(http2=self.http2, limits=self.limits)
+
+    @client.setter
+    def client(self, client: httpx.Client):
+        self._client = client
 
     def __enter__(self):
         return self
@@ -69,16 +191,14 @@ class SyncHttpClient:
         self._close()
 
     def _build_url(self, path):
-        if self.base_url:
-            return urljoin(self.base_url.rstrip('/') + '/', path.lstrip('/'))
-        return path
+        return _build_url(self.base_url, path)
 
     def _request(self, method, url, **kwargs):
         try:
-            response = self.client.request(method, url, **kwargs)
+            response = self.client.request(method, url, **_request_kwargs(self, kwargs))
             response.raise_for_status()
             try:
-                return {"status": response.status_code, "data": response.json()}
+                return {"status": response.status_code, "data": _loads_json(response.content)}
             except Exception:
                 return {"status": response.status_code, "data": response.text}
         except httpx.HTTPStatusError as exc:
@@ -93,7 +213,9 @@ class SyncHttpClient:
 
     def _post(self, path, data=None, json=None, **kwargs):
         url = self._build_url(path)
-        return self._request("POST", url, data=data, json=json, **kwargs)
+        if json is not None and data is None:
+            kwargs.update(_json_kwargs(json, kwargs, self.headers))
+        return self._request("POST", url, data=data, **kwargs)
 
     def _put(self, path, data=None, **kwargs):
         url = self._build_url(path)
@@ -104,7 +226,8 @@ class SyncHttpClient:
         return self._request("DELETE", url, **kwargs)
 
     def _close(self):
-        self.client.close()
+        if self._client is not None:
+            self._client.close()
 
 # 使用示例
 if __name__ == "__main__":
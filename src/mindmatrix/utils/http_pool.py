@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import weakref
+from typing import Dict, Tuple
+
+import httpx
+from loguru import logger
+
+
+# 并发请求（如记忆、向量化接口的扇出调用）共享的连接池上限
+DEFAULT_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=30)
+DEFAULT_TIMEOUT = 30.0
+
+_PoolKey = Tuple[bool, int, int, float]
+
+# httpx.AsyncClient 的连接绑定在创建它的事件循环上，因此按事件循环分别缓存
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[_PoolKey, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+_sync_clients: Dict[_PoolKey, httpx.Client] = {}
+_sync_lock = threading.Lock()
+
+
+def _pool_key(http2: bool, limits: httpx.Limits) -> _PoolKey:
+    return (http2, limits.max_connections, limits.max_keepalive_connections, limits.keepalive_expiry)
+
+
+def get_async_client(http2: bool = True, limits: httpx.Limits = DEFAULT_LIMITS) -> httpx.AsyncClient:
+    """
+    获取当前事件循环共享的 httpx.AsyncClient（惰性创建）
+
+    所有 AsyncHttpClient 子类复用同一个连接池，避免每个实例各自握手建连。
+
+    Args:
+        http2: 是否启用 HTTP/2
+        limits: 连接池上限，不同的配置使用不同的共享客户端
+    """
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    key = _pool_key(http2, limits)
+    client = clients.get(key)
+    if client is None or client.is_closed:
+        logger.debug(f"creating shared async http client, http2: {http2}, limits: {limits}")
+        client = clients[key] = httpx.AsyncClient(http2=http2, limits=limits, timeout=DEFAULT_TIMEOUT)
+    return client
+
+
+def get_sync_client(http2: bool = True, limits: httpx.Limits = DEFAULT_LIMITS) -> httpx.Client:
+    """
+    获取进程内共享的 httpx.Client（惰性创建，线程安全）
+
+    Args:
+        http2: 是否启用 HTTP/2
+        limits: 连接池上限，不同的配置使用不同的共享客户端
+    """
+    key = _pool_key(http2, limits)
+    with _sync_lock:
+        client = _sync_clients.get(key)
+        if client is None or client.is_closed:
+            logger.debug(f"creating shared sync http client, http2: {http2}, limits: {limits}")
+            client = _sync_clients[key] = httpx.Client(http2=http2, limits=limits, timeout=DEFAULT_TIMEOUT)
+    return client
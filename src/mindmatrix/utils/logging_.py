@@ -0,0 +1,13 @@
+from loguru import logger
+
+
+_DEBUG_LEVEL_NO = logger.level("DEBUG").no
+
+
+def debug_enabled() -> bool:
+    """
+    是否有 sink 会输出 DEBUG 级别日志
+
+    用于在热点路径上跳过开销较大的调试日志（如 pformat、大对象转字符串）。
+    """
+    return logger._core.min_level <= _DEBUG_LEVEL_NO
@@ -1,10 +1,21 @@
-from typing import Dict, Any, List, Optional, Literal
+from typing import Dict, Any, List, Optional, Literal, Tuple
 import json
-import uuid
+import secrets
+import asyncio
 
+import httpx
 from loguru import logger
 
 from .http_client import AsyncHttpClient, SyncHttpClient
+from .response_cache import ChatCompletionCache, TTLCache, make_cache_key
+
+
+# 接口路径模板
+_PATH_CHAT = "/mm/v1/{type_}/chat/completions"
+_PATH_CHAT_BATCH = "/mm/v1/{type_}/chat/completions/batch"
+_PATH_CHAT_SSE = "/mm/v1/sse/{type_}/chat/completions"
+_PATH_MEMORIES = "/mm/v1/memory/{user_id}/memories"
+_PATH_MEMORY = "/mm/v1/memory/{user_id}/memories/{memory_id}"
 
 
 class MindMatrixError(Exception):
@@ -12,19 +23,128 @@ class MindMatrixError(Exception):
     pass
 
 
+class _BatchQueue:
+    """
+    合并并发的非流式 chat_completion 请求
+
+    同一 (model, type_) 的请求在 `window_ms` 时间窗口内或累计达到 `max_batch` 条后，
+    合并为一次批量接口调用，并按顺序将结果分发给各个调用方。
+    服务端不支持批量接口（404）时回退为逐条请求。
+    """
+
+    def __init__(self, client: "AsyncMindMatrixClient", window_ms: float = 10, max_batch: int = 16):
+        self._client = client
+        self._window = window_ms / 1000
+        self._max_batch = max_batch
+        self._pending: Dict[Tuple[str, str], List[Tuple[Dict[str, Any], asyncio.Future]]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._tasks = set()
+        self._batch_supported = True
+
+    async def submit(self, model: str, type_: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (model, type_)
+        group = self._pending.setdefault(key, [])
+        group.append((payload, future))
+
+        if len(group) >= self._max_batch:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self._window, self._flush, key)
+        return await future
+
+    def _flush(self, key: Tuple[str, str]) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(key, None)
+        if not items:
+            return
+        task = asyncio.get_running_loop().create_task(self._send(key, items))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, key: Tuple[str, str], items) -> None:
+        """发送一批请求；任何异常都会传递给尚未完成的调用方，不会让调用方一直等待"""
+        try:
+            await self._dispatch(key, items)
+        except Exception as e:
+            logger.opt(exception=True).warning("batch chat completion failed")
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            # 被取消或服务端未返回对应结果时，同样结束剩余的调用方
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(MindMatrixError("Failed to get chat completion: no response"))
+
+    async def _dispatch(self, key: Tuple[str, str], items) -> None:
+        model, type_ = key
+        if len(items) > 1 and self._batch_supported:
+            path = _PATH_CHAT_BATCH.format(type_=type_)
+            batch_payload = {"model": model, "messages_list": [payload["messages"] for payload, _ in items]}
+            response = await self._client._post(path, json=batch_payload, headers=self._client.headers)
+            logger.opt(lazy=True).debug("batch chat response: {}", lambda: response)
+
+            if response.get("status") == 200:
+                responses = (response.get("data") or {}).get("responses")
+                if not isinstance(responses, list) or len(responses) != len(items):
+                    got = len(responses) if isinstance(responses, list) else type(responses).__name__
+                    raise MindMatrixError(f"Unexpected batch chat response: expected {len(items)} responses, got {got}")
+                for (_, future), data in zip(items, responses):
+                    if future.done():
+                        continue
+                    if "error" in data:
+                        future.set_exception(MindMatrixError(f"Failed to get chat completion: {data['error']}"))
+                    else:
+                        future.set_result(data)
+                return
+            if response.get("status") != 404:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(MindMatrixError(
+                            f"Failed to get chat completion: ({response.get('status')}) {response.get('error')}"
+                        ))
+                return
+
+            logger.warning("batch chat completions is not supported by server, fallback to single requests")
+            self._batch_supported = False
+
+        async def send_one(payload, future):
+            try:
+                data = await self._client._post_chat_completion(_PATH_CHAT.format(type_=type_), payload)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(data)
+
+        await asyncio.gather(*(send_one(payload, future) for payload, future in items))
+
+
 class AsyncMindMatrixClient(AsyncHttpClient):
     def __init__(
         self, 
         base_url: str = "http://localhost:9527", 
         api_key: str = None,
+        cache: Optional[ChatCompletionCache] = None,
+        batch_window_ms: Optional[float] = None,
+        max_batch: int = 16,
     ):
         super().__init__(base_url=base_url)
         self.api_key = api_key
-        self.headers = {
-            "Content-Type": "application/json"
-        }
-        if api_key:
-            self.headers["Authorization"] = f"Bearer {self.api_key}"
+        self.cache = cache
+        self._batch_queue = _BatchQueue(self, batch_window_ms, max_batch) if batch_window_ms else None
+        # 进行中的非流式请求，相同请求并发到达时复用同一个上游调用
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # 请求头在实例创建后不再变化，各请求直接复用
+        self.headers = httpx.Headers({
+            "Content-Type": "application/json",
+            **({"Authorization": f"Bearer {self.api_key}"} if api_key else {}),
+        })
 
     async def chat_completion(
         self, 
@@ -48,9 +168,20 @@ class AsyncMindMatrixClient(AsyncHttpClient):
             
         Returns:
             响应数据
+
+        Note:
+            创建客户端时传入 `cache` 后，非流式请求会先查询响应缓存，命中时不再请求服务端；
+            传入 `batch_window_ms` 后，并发的非流式请求会在时间窗口内合并为一次批量请求；
+            参数完全相同的并发非流式请求只会发起一次上游调用
         """
+        inflight_key = None
+        if not stream:
+            inflight_key = make_cache_key(
+                model=model, messages=messages, session_id=session_id, user_id=user_id, type_=type_
+            )
+
         if not session_id:
-            session_id = str(uuid.uuid4())
+            session_id = secrets.token_hex(16)
             
         payload = {
             "model": model,
@@ -62,23 +193,55 @@ class AsyncMindMatrixClient(AsyncHttpClient):
         if user_id:
             payload["user_id"] = user_id
             
-        path = f"/mm/v1/sse/{type_}/chat/completions"
+        path = _PATH_CHAT_SSE.format(type_=type_)
         
         if stream:
             # 流式响应处理
             response = await self._post(path, json=payload, headers=self.headers)
-            logger.debug(f"stream chat response: {response}")
+            logger.opt(lazy=True).debug("stream chat response: {}", lambda: response)
             return response
         else:
-            # 非流式响应
-            path = f"/mm/v1/{type_}/chat/completions"
-            response = await self._post(path, json=payload, headers=self.headers)
-            logger.debug(f"chat response: {response}")
-            
-            if response.get("status") != 200:
-                raise MindMatrixError(f"Failed to get chat completion: ({response.get('status')}) {response.get('error')}")
-            
-            return response.get("data", {})
+            # 非流式响应，优先查询响应缓存
+            lookup = None
+            if self.cache is not None:
+                lookup = await self.cache.lookup(model=model, messages=messages, type_=type_, user_id=user_id)
+                if lookup.hit:
+                    logger.opt(lazy=True).debug("chat response from cache: {}", lambda: lookup.data)
+                    return lookup.data
+
+            task = self._inflight.get(inflight_key)
+            if task is None:
+                task = asyncio.create_task(self._fetch_chat_completion(model, type_, payload, lookup))
+                self._inflight[inflight_key] = task
+                task.add_done_callback(lambda t: self._inflight.pop(inflight_key, None))
+            else:
+                logger.debug("join in-flight chat request: {}", inflight_key)
+            # shield: 单个调用方取消时不影响其他等待同一请求的调用方
+            return await asyncio.shield(task)
+
+    async def _fetch_chat_completion(
+        self,
+        model: str,
+        type_: str,
+        payload: Dict[str, Any],
+        lookup=None,
+    ) -> Dict[str, Any]:
+        if self._batch_queue is not None:
+            data = await self._batch_queue.submit(model, type_, payload)
+        else:
+            data = await self._post_chat_completion(_PATH_CHAT.format(type_=type_), payload)
+        if lookup is not None:
+            self.cache.store(lookup, data)
+        return data
+
+    async def _post_chat_completion(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        response = await self._post_stream_json(path, json=payload, headers=self.headers)
+        logger.opt(lazy=True).debug("chat response: {}", lambda: response)
+
+        if response.get("status") != 200:
+            raise MindMatrixError(f"Failed to get chat completion: ({response.get('status')}) {response.get('error')}")
+
+        return response.get("data", {})
 
     async def get_memories(self, user_id: str) -> List[Dict[str, Any]]:
         """
@@ -90,9 +253,9 @@ class AsyncMindMatrixClient(AsyncHttpClient):
         Returns:
             用户记忆列表
         """
-        path = f"/mm/v1/memory/{user_id}/memories"
+        path = _PATH_MEMORIES.format(user_id=user_id)
         response = await self._get(path, headers=self.headers)
-        logger.debug(f"get memories response: {response}")
+        logger.opt(lazy=True).debug("get memories response: {}", lambda: response)
         
         if response.get("status") != 200:
             raise MindMatrixError(f"Failed to get memories: ({response.get('status')}) {response.get('error')}")
@@ -116,14 +279,14 @@ class AsyncMindMatrixClient(AsyncHttpClient):
         Returns:
             添加结果
         """
-        path = f"/mm/v1/memory/{user_id}/memories"
+        path = _PATH_MEMORIES.format(user_id=user_id)
         payload = {
             "memory": memory,
             "topics": topics or []
         }
         
         response = await self._post(path, json=payload, headers=self.headers)
-        logger.debug(f"add memory response: {response}")
+        logger.opt(lazy=True).debug("add memory response: {}", lambda: response)
         
         if response.get("status") != 200:
             raise MindMatrixError(f"Failed to add memory: ({response.get('status')}) {response.get('error')}")
@@ -145,10 +308,10 @@ class AsyncMindMatrixClient(AsyncHttpClient):
         Returns:
             删除结果
         """
-        path = f"/mm/v1/memory/{user_id}/memories/{memory_id}"
+        path = _PATH_MEMORY.format(user_id=user_id, memory_id=memory_id)
         
         response = await self._delete(path, headers=self.headers)
-        logger.debug(f"delete memory response: {response}")
+        logger.opt(lazy=True).debug("delete memory response: {}", lambda: response)
         
         if response.get("status") != 200:
             raise MindMatrixError(f"Failed to delete memory: ({response.get('status')}) {response.get('error')}")
@@ -157,18 +320,24 @@ class AsyncMindMatrixClient(AsyncHttpClient):
 
 
 class MindMatrixClient(SyncHttpClient):
+    # 进程内共享的非流式响应缓存，所有开启缓存的实例共用
+    _response_cache = TTLCache(maxsize=1024, ttl=3600)
+
     def __init__(
         self, 
         base_url: str = "http://localhost:9527", 
         api_key: str = None,
+        use_cache: bool = False,
     ):
         super().__init__(base_url=base_url)
         self.api_key = api_key
-        self.headers = {
-            "Content-Type": "application/json"
-        }
-        if api_key:
-            self.headers["Authorization"] = f"Bearer {self.api_key}"
+        self.use_cache = use_cache
+        self.cache_stats: Dict[str, int] = {"hit": 0, "miss": 0}
+        # 请求头在实例创建后不再变化，各请求直接复用
+        self.headers = httpx.Headers({
+            "Content-Type": "application/json",
+            **({"Authorization": f"Bearer {self.api_key}"} if api_key else {}),
+        })
 
     def chat_completion(
         self, 
@@ -192,9 +361,25 @@ class MindMatrixClient(SyncHttpClient):
             
         Returns:
             响应数据
+
+        Note:
+            创建客户端时传入 `use_cache=True` 后，非流式请求的响应会缓存在进程内（1 小时），
+            按 base_url、model、messages、type_、user_id 匹配
         """
+        cache_key = None
+        if self.use_cache and not stream:
+            cache_key = make_cache_key(
+                base_url=self.base_url, model=model, messages=messages, type_=type_, user_id=user_id
+            )
+            data = self._response_cache.get(cache_key)
+            if data is not None:
+                self.cache_stats["hit"] += 1
+                logger.opt(lazy=True).debug("chat response from cache: {}", lambda: data)
+                return data
+            self.cache_stats["miss"] += 1
+
         if not session_id:
-            session_id = str(uuid.uuid4())
+            session_id = secrets.token_hex(16)
             
         payload = {
             "model": model,
@@ -206,23 +391,30 @@ class MindMatrixClient(SyncHttpClient):
         if user_id:
             payload["user_id"] = user_id
             
-        path = f"/mm/v1/sse/{type_}/chat/completions"
+        path = _PATH_CHAT_SSE.format(type_=type_)
         
         if stream:
             # 流式响应处理
             response = self._post(path, json=payload, headers=self.headers)
-            logger.debug(f"stream chat response: {response}")
+            logger.opt(lazy=True).debug("stream chat response: {}", lambda: response)
             return response
         else:
             # 非流式响应
-            path = f"/mm/v1/{type_}/chat/completions"
+            path = _PATH_CHAT.format(type_=type_)
             response = self._post(path, json=payload, headers=self.headers)
-            logger.debug(f"chat response: {response}")
+            logger.opt(lazy=True).debug("chat response: {}", lambda: response)
             
             if response.get("status") != 200:
                 raise MindMatrixError(f"Failed to get chat completion: ({response.get('status')}) {response.get('error')}")
             
-            return response.get("data", {})
+            data = response.get("data", {})
+            if cache_key is not None:
+                self._response_cache.set(cache_key, data)
+            return data
+
+    def invalidate_cache(self) -> None:
+        """清空进程内共享的响应缓存"""
+        self._response_cache.clear()
 
     def get_memories(self, user_id: str) -> List[Dict[str, Any]]:
         """
@@ -234,9 +426,9 @@ class MindMatrixClient(SyncHttpClient):
         Returns:
             用户记忆列表
         """
-        path = f"/mm/v1/memory/{user_id}/memories"
+        path = _PATH_MEMORIES.format(user_id=user_id)
         response = self._get(path, headers=self.headers)
-        logger.debug(f"get memories response: {response}")
+        logger.opt(lazy=True).debug("get memories response: {}", lambda: response)
         
         if response.get("status") != 200:
             raise MindMatrixError(f"Failed to get memories: ({response.get('status')}) {response.get('error')}")
@@ -260,14 +452,14 @@ class MindMatrixClient(SyncHttpClient):
         Returns:
             添加结果
         """
-        path = f"/mm/v1/memory/{user_id}/memories"
+        path = _PATH_MEMORIES.format(user_id=user_id)
         payload = {
             "memory": memory,
             "topics": topics or []
         }
         
         response = self._post(path, json=payload, headers=self.headers)
-        logger.debug(f"add memory response: {response}")
+        logger.opt(lazy=True).debug("add memory response: {}", lambda: response)
         
         if response.get("status") != 200:
             raise MindMatrixError(f"Failed to add memory: ({response.get('status')}) {response.get('error')}")
@@ -289,10 +481,10 @@ class MindMatrixClient(SyncHttpClient):
         Returns:
             删除结果
         """
-        path = f"/mm/v1/memory/{user_id}/memories/{memory_id}"
+        path = _PATH_MEMORY.format(user_id=user_id, memory_id=memory_id)
         
         response = self._delete(path, headers=self.headers)
-        logger.debug(f"delete memory response: {response}")
+        logger.opt(lazy=True).debug("delete memory response: {}", lambda: response)
         
         if response.get("status") != 200:
             raise MindMatrixError(f"Failed to delete memory: ({response.get('status')}) {response.get('error')}")
@@ -1,10 +1,15 @@
+import asyncio
+from heapq import nlargest
+from operator import itemgetter
 from pprint import pformat
 from typing import List, Optional
 
 from loguru import logger
 from agno.embedder.base import Embedder
 
+from .logging_ import debug_enabled
 from .reranker_client import AsyncRerankerClient
+from .response_cache import TTLCache
 
 try:
     from pymilvus import MilvusClient
@@ -12,6 +17,28 @@ except ImportError:
     logger.error("pymilvus is not installed, please install it with: pip install pymilvus")
 
 
+# 召回与重排序使用的指令
+_EMBED_PREFIX = "Instruct: 根据用户的指令，召回能够完成该指令任务的智能体。\nQuery:"
+_RERANK_INSTR_DEFAULT = "根据用户的指令，召回能够完成该指令任务的智能体。"
+_RERANK_INSTR_TMPL = "{bg}。根据以上背景信息(如年龄、职业、兴趣爱好等)，结合用户查询，召回对应的智能体。"
+
+# 查询向量缓存，相同的向量化输入（含指令前缀）不再重复调用 embedder
+_embedding_cache = TTLCache(maxsize=4096, ttl=None)
+
+
+async def _cached_embed(embedder: Embedder, text: str) -> List[float]:
+    key = (id(embedder), getattr(embedder, "id", None), getattr(embedder, "dimensions", None), text)
+    embedding = _embedding_cache.get(key)
+    if embedding is None:
+        embedding = tuple(await asyncio.to_thread(embedder.get_embedding, text))
+        # 向量化失败时 embedder 返回空列表，不缓存
+        if embedding:
+            _embedding_cache.set(key, embedding)
+    else:
+        logger.debug("query embedding cache hit")
+    return list(embedding)
+
+
 class MilvusAnnotatedResponseMixin:
     """
     标注回复
@@ -34,34 +61,64 @@ class MilvusAnnotatedResponseMixin:
         metric_type: str = "COSINE",
         filter: str = "",
         limit: int = 5,
+        consistency_level: Optional[str] = None,
+        skip_rerank_gap: Optional[float] = None,
     ) -> List[str]:
+        """
+        Args:
+            skip_rerank_gap: 前两条召回结果的相似度差值不小于该值时跳过重排序（如 COSINE 取 0.08），
+                为 None 时总是重排序
+        """
         query = query[-1]["content"] if isinstance(query, list) else query
 
-        docs = await cls._retrieve_documents(
-            f"Instruct: 根据用户的指令，召回能够完成该指令任务的智能体。\nQuery:{query}",
-            embedder,
-            milvus,
-            collection_name,
-            anns_field,
-            output_fields,
-            similarity_threshold=similarity_threshold,
-            metric_type=metric_type,
-            filter=filter,
-            limit=limit,
-        )
+        # 召回的同时预热重排序服务的连接
+        warm_task = None
+        if use_reranker and reranker is not None:
+            warm_task = asyncio.create_task(reranker.ensure_connected())
+
+        retrieved = False
+        try:
+            docs = await cls._retrieve_documents(
+                _EMBED_PREFIX + query,
+                embedder,
+                milvus,
+                collection_name,
+                anns_field,
+                output_fields,
+                similarity_threshold=similarity_threshold,
+                metric_type=metric_type,
+                filter=filter,
+                limit=limit,
+                consistency_level=consistency_level,
+                include_distance=skip_rerank_gap is not None,
+            )
+            retrieved = True
+        finally:
+            if warm_task is not None:
+                # 召回失败时不再需要预热，取消后同样等待任务结束，避免遗留未回收的任务
+                if not retrieved:
+                    warm_task.cancel()
+                await asyncio.gather(warm_task, return_exceptions=True)
+
+        if skip_rerank_gap is not None:
+            distances = [doc.pop("distance") for doc in docs]
+            # 召回结果已按相似度排序，首条与次条差距足够大时重排序不会改变结果
+            if use_reranker and len(docs) > 1 and abs(distances[0] - distances[1]) >= skip_rerank_gap:
+                logger.bind(rerank_skipped=True).info(
+                    f"skip rerank, similarity gap: {abs(distances[0] - distances[1]):.4f} >= {skip_rerank_gap}"
+                )
+                return docs
 
         if use_reranker and len(docs) > 1:
             rerank_docs = [item[content_field] for item in docs]
             rerank_results = await cls._rerank_documents(
                 query=query,
-                instruction=f"{background_info}。根据以上背景信息(如年龄、职业、兴趣爱好等)，结合用户查询，召回对应的智能体。" \
-                    if background_info else \
-                    f"根据用户的指令，召回能够完成该指令任务的智能体。",
+                instruction=_RERANK_INSTR_TMPL.format(bg=background_info) if background_info else _RERANK_INSTR_DEFAULT,
                 documents=rerank_docs,
                 reranker_client=reranker,
             )
             docs = [docs[item["index"]] for item in rerank_results]
-            logger.debug(f"reranked docs: {docs}")
+            logger.opt(lazy=True).debug("reranked docs: {}", lambda: docs)
         
         return docs
 
@@ -79,15 +136,26 @@ class MilvusAnnotatedResponseMixin:
         metric_type: str = "COSINE",
         filter: str = "",
         limit: int = 5,
+        consistency_level: Optional[str] = None,
+        include_distance: bool = False,
     ) -> List[dict]:
         """
         检索文档
+
+        Args:
+            consistency_level: 检索的一致性级别（如 "Eventually"），为 None 时使用集合的默认级别
+            include_distance: 是否在结果中附带相似度（`distance` 字段）
         """
         logger.info(f"embedding query:\n{query}")
-        embeddings = embedder.get_embedding(query)
-        logger.debug(f"get query embedding: {embeddings[:10]}, len: {len(embeddings)}")
+        embeddings = await _cached_embed(embedder, query)
+        logger.opt(lazy=True).debug(
+            "get query embedding: {}, len: {}", lambda: embeddings[:10], lambda: len(embeddings)
+        )
 
-        res = milvus.search(
+        search_kwargs = {"consistency_level": consistency_level} if consistency_level else {}
+        # MilvusClient 为同步客户端，放到线程中执行以免阻塞事件循环
+        res = await asyncio.to_thread(
+            milvus.search,
             collection_name=collection_name, 
             anns_field=anns_field,
             data=[embeddings],
@@ -95,28 +163,36 @@ class MilvusAnnotatedResponseMixin:
             filter=filter,
             search_params={"metric_type": metric_type},
             output_fields=output_fields,
+            **search_kwargs,
         )
-        if res and len(res) > 0:
-            logger.info(f"Found {len(res[0])} search results:")
+        if not res or len(res) == 0:
+            logger.debug("No search results found")
+            return []
+
+        debug = debug_enabled()
+        logger.info(f"Found {len(res[0])} search results:")
+        if debug:
             for i, item in enumerate(res[0]):
                 logger.debug(f"Result {i}: {pformat(item)}")
 
-            if similarity_threshold is not None:
-                logger.info(f"filtering docs by similarity threshold ({similarity_threshold})")
-                results = [
-                    {key: item["entity"][key] for key in output_fields}
-                    for item in res[0]
-                    if item["distance"] >= similarity_threshold
-                ]
-                logger.info(f"Found {len(results)} search results after filtering by similarity threshold ({similarity_threshold}):")
+        # 单次遍历完成相似度过滤与字段提取
+        fields = tuple(output_fields)
+        threshold = similarity_threshold if similarity_threshold is not None else -float("inf")
+        results = []
+        for item in res[0]:
+            if item["distance"] >= threshold:
+                entity = item["entity"]
+                doc = {key: entity[key] for key in fields}
+                if include_distance:
+                    doc["distance"] = item["distance"]
+                results.append(doc)
+
+        if similarity_threshold is not None:
+            logger.info(f"Found {len(results)} search results after filtering by similarity threshold ({similarity_threshold}):")
+            if debug:
                 for i, item in enumerate(results):
                     logger.debug(f"Result {i}: {pformat(item)}")
-
-                return results
-            return [{key: item["entity"][key] for key in output_fields} for item in res[0]]
-        else:
-            logger.debug("No search results found")
-            return []
+        return results
 
     @classmethod
     async def _rerank_documents(
@@ -125,6 +201,8 @@ class MilvusAnnotatedResponseMixin:
         instruction: str,
         reranker_client: AsyncRerankerClient,
         documents: List[str],
+        shard_size: int = 32,
+        limit: Optional[int] = None,
     ) -> List[dict]:
         """
         对文档进行重排序
@@ -135,6 +213,8 @@ class MilvusAnnotatedResponseMixin:
             model: 使用的重排序模型
             api_key: API密钥
             base_url: API基础URL
+            shard_size: 单次打分请求的文档数，超出时分片并发请求
+            limit: 返回得分最高的前 limit 条结果，默认返回全部
             
         Returns:
             重排序后的文档列表，包含分数和排名信息
@@ -142,16 +222,35 @@ class MilvusAnnotatedResponseMixin:
         try:
             logger.info(f"Starting rerank for query: '{query}' with {len(documents)} documents")
             
-            results = await reranker_client.score(
-                instruction=instruction, 
-                queries=[query] * len(documents), 
-                documents=documents,
-            )
+            if len(documents) > shard_size:
+                # 按长度降序分片，使每个分片内的文档长度接近
+                order = sorted(range(len(documents)), key=lambda i: len(documents[i]), reverse=True)
+                shards = [order[i:i + shard_size] for i in range(0, len(order), shard_size)]
+                shard_results = await asyncio.gather(*(
+                    reranker_client.score(
+                        instruction=instruction,
+                        queries=query,
+                        documents=[documents[i] for i in shard],
+                    )
+                    for shard in shards
+                ))
+                # 分片内的 index 是相对下标，需要映射回原始下标
+                results = [
+                    {**item, "index": shard[item["index"]]}
+                    for shard, shard_result in zip(shards, shard_results)
+                    for item in shard_result or ()
+                ]
+            else:
+                results = await reranker_client.score(
+                    instruction=instruction, 
+                    queries=query,
+                    documents=documents,
+                )
             if results and len(results) > 0:
-                # 按照score字段降序排序
-                results = sorted(results, key=lambda x: x.get('score', 0), reverse=True)
+                # 按照score字段降序取前 limit 条
+                results = nlargest(limit or len(documents), filter(None, results), key=itemgetter("score"))
                 logger.info(f"Found {len(results)} rerank results:")
-                for i, item in enumerate(results):
+                for i, item in enumerate(results if debug_enabled() else ()):
                     logger.debug(f"Rerank Result {i}: {pformat(item)}, doc: 「{documents[item['index']]}」")
 
             return results
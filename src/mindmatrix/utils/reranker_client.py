@@ -1,54 +1,152 @@
-from typing import Dict, Any, List
+import asyncio
+import hashlib
+from operator import itemgetter
+from typing import Dict, Any, Awaitable, Callable, Final, Hashable, List, Union
 
+import httpx
+import orjson
 from loguru import logger
 
 from .http_client import AsyncHttpClient, SyncHttpClient
+from .response_cache import TTLCache
+
+
+# score 接口的固定提示词片段。/score 接口没有独立的指令字段，前缀只能随 query 发送：
+# 单个 query 时由服务端广播（text_1 为字符串），前缀在请求体中只出现一次
+_SCORE_PREFIX: Final[str] = '<|im_start|>system\nJudge whether the Document meets the requirements based on the Query and the Instruct provided. Note that the answer can only be "yes" or "no".<|im_end|>\n<|im_start|>user\n'
+_SCORE_SUFFIX: Final[str] = "<|im_end|>\n<|im_start|>assistant\n<think>\n\n</think>\n\n"
+_DOCUMENT_HEAD: Final[str] = "<Document>: "
+# 文档片段 JSON 转义后的字节（含两端引号），拼接请求体时直接复用
+_DOCUMENT_HEAD_JSON: Final[bytes] = b'"' + orjson.dumps(_DOCUMENT_HEAD)[1:-1]
+_SCORE_SUFFIX_JSON: Final[bytes] = orjson.dumps(_SCORE_SUFFIX)[1:-1] + b'"'
+
+# 重排序请求通常间隔较长，保留更久的 keep-alive 连接以免重复握手
+_RERANKER_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60)
+# 文档较多时拆分为多个并发请求，同时进行的请求数上限
+_RERANK_CONCURRENCY = 8
 
 
 class RerankerError(Exception):
     ...
 
 
+def _digest(texts: List[str]) -> bytes:
+    """文档列表的摘要，用作缓存键的一部分"""
+    return hashlib.blake2b("\0".join(texts).encode("utf-8"), digest_size=16).digest()
+
+
+def _length_order(texts: List[str]) -> List[int]:
+    """按文本长度降序排列的下标"""
+    return sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+
+
 class AsyncRerankerClient(AsyncHttpClient):
+    # 打分结果缓存（进程内共享，需 use_cache=True 开启），相同的凭证、模型、query 与文档列表直接返回上次结果
+    _result_cache = TTLCache(maxsize=1024, ttl=300)
+
     def __init__(
         self, 
         base_url: str = "https://api.siliconflow.cn/v1", 
         model: str = None, 
         api_key: str = None,
+        limits: httpx.Limits = _RERANKER_LIMITS,
+        use_cache: bool = False,
+        rerank_batch_size: int = 32,
     ):
-        super().__init__(base_url=base_url)
+        super().__init__(base_url=base_url, limits=limits)
         self.model = model
         self.api_key = api_key
-        self.headers = {
+        self.use_cache = use_cache
+        # 缓存键包含凭证摘要，不同 api_key 的调用方不会共享缓存结果
+        self._credential_key = _digest([api_key or ""])
+        self.rerank_batch_size = rerank_batch_size
+        # 进行中的请求，相同请求并发到达时复用同一个上游调用
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.headers = httpx.Headers({
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
-        }
+        })
+
+    async def _cached(self, key: Hashable, fetch: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        """查询结果缓存，未命中时合并并发的相同请求，只请求一次服务端"""
+        if not self.use_cache:
+            return await fetch()
+        key = (self.base_url, self.model, self._credential_key, *key)
+        results = self._result_cache.get(key)
+        if results is not None:
+            logger.debug("reranker result cache hit")
+            return list(results)
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(fetch())
+            self._inflight[key] = task
+
+            def done(t: asyncio.Task) -> None:
+                self._inflight.pop(key, None)
+                if not t.cancelled() and t.exception() is None and t.result() is not None:
+                    self._result_cache.set(key, t.result())
+
+            task.add_done_callback(done)
+        # shield: 单个调用方取消时不影响其他等待同一请求的调用方
+        results = await asyncio.shield(task)
+        return list(results) if results is not None else results
+
+    async def score(
+        self, instruction: str, queries: Union[str, List[str]], documents: List[str]
+    ) -> List[Dict[str, Any]]:
+        """
+        对 query 与文档逐对打分
+
+        Args:
+            instruction: 打分指令
+            queries: 查询文本；传入单个字符串时与每个文档配对（由服务端广播，请求体只携带一份）
+            documents: 待打分的文档列表
+        """
+        if not documents:
+            return []
+        query_key = queries if isinstance(queries, str) else _digest(queries)
+        return await self._cached(
+            ("score", instruction, query_key, _digest(documents)),
+            lambda: self._score(instruction, queries, documents),
+        )
 
-    async def score(self, instruction: str, queries: List[str], documents: List[str]) -> List[Dict[str, Any]]:
-        prefix = '<|im_start|>system\nJudge whether the Document meets the requirements based on the Query and the Instruct provided. Note that the answer can only be "yes" or "no".<|im_end|>\n<|im_start|>user\n'
-        suffix = "<|im_end|>\n<|im_start|>assistant\n<think>\n\n</think>\n\n"
+    async def _score(
+        self, instruction: str, queries: Union[str, List[str]], documents: List[str]
+    ) -> List[Dict[str, Any]]:
+        # 按长度降序发送文档，减少服务端批内 padding；返回前将 index 还原为原始下标
+        order = _length_order(documents)
+        documents = [documents[i] for i in order]
 
-        query_template = "{prefix}<Instruct>: {instruction}\n<Query>: {query}\n"
-        document_template = "<Document>: {doc}{suffix}"
+        # 指令部分对所有 query 相同，只拼接一次
+        query_head = f"{_SCORE_PREFIX}<Instruct>: {instruction}\n<Query>: "
+        if isinstance(queries, str):
+            queries = query_head + queries + "\n"
+        else:
+            if len(queries) == len(order):
+                # query 与文档逐对配对时保持配对关系
+                queries = [queries[i] for i in order]
+            queries = [query_head + query + "\n" for query in queries]
 
-        queries = [
-            query_template.format(prefix=prefix, instruction=instruction, query=query)
-            for query in queries
-        ]
-        documents = [
-            document_template.format(doc=doc, suffix=suffix) for doc in documents
-        ]
+        # 文档数量较多，直接在字节层面拼接请求体，省去每个文档的中间字符串
+        documents = b",".join(
+            _DOCUMENT_HEAD_JSON + orjson.dumps(doc)[1:-1] + _SCORE_SUFFIX_JSON for doc in documents
+        )
+        body = b"".join((
+            b'{"model":', orjson.dumps(self.model),
+            b',"text_1":', orjson.dumps(queries),
+            b',"text_2":[', documents,
+            b'],"truncate_prompt_tokens":-1}',
+        ))
 
         path = "/score"
-        payload = {
-            "model": self.model,
-            "text_1": queries,
-            "text_2": documents,
-            "truncate_prompt_tokens": -1,
-        }
-        response = await self._post(path, json=payload, headers=self.headers)
-        logger.debug(f"score response: {response}")
-        return response["data"]["data"] # TODO: 处理HTTP Error
+        response = await self._post(path, content=body)
+        logger.opt(lazy=True).debug("score response: {}", lambda: response)
+        results = response["data"]["data"] # TODO: 处理HTTP Error
+        return sorted(
+            ({**item, "index": order[item["index"]]} for item in results),
+            key=itemgetter("index"),
+        )
 
     async def rerank(self, query: str, documents: List[str]) -> List[Dict[str, Any]]:
         """
@@ -62,6 +160,33 @@ class AsyncRerankerClient(AsyncHttpClient):
         Returns:
             重排序后的文档列表，包含分数和排名信息
         """
+        if not documents:
+            return []
+        return await self._cached(
+            ("rerank", query, _digest(documents)),
+            lambda: self._rerank(query, documents),
+        )
+
+    async def _rerank(self, query: str, documents: List[str]) -> List[Dict[str, Any]]:
+        batch_size = self.rerank_batch_size
+        # 按长度降序发送并分批，使每批文档长度接近；文档较多时各批并发请求，按原始下标合并
+        order = _length_order(documents)
+        batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+        semaphore = asyncio.Semaphore(_RERANK_CONCURRENCY)
+
+        async def rerank_batch(indices: List[int]) -> List[Dict[str, Any]]:
+            async with semaphore:
+                results = await self._post_rerank(query, [documents[i] for i in indices])
+            return [{**item, "index": indices[item["index"]]} for item in results]
+
+        batch_results = await asyncio.gather(*(rerank_batch(indices) for indices in batches))
+        return sorted(
+            (item for results in batch_results for item in results),
+            key=lambda item: item.get("relevance_score", 0.0),
+            reverse=True,
+        )
+
+    async def _post_rerank(self, query: str, documents: List[str]) -> List[Dict[str, Any]]:
         path = "/rerank"
         payload = {
             "model": self.model,
@@ -69,7 +194,7 @@ class AsyncRerankerClient(AsyncHttpClient):
             "documents": documents
         }
         
-        response = await self._post(path, json=payload, headers=self.headers)
+        response = await self._post(path, json=payload)
         if response["status"] != 200:
             raise RerankerError(f"Failed to rerank documents: ({response['status']}) {response['error']}")
         
@@ -82,14 +207,15 @@ class RerankerClient(SyncHttpClient):
         base_url: str = "https://api.siliconflow.cn/v1", 
         model: str = None, 
         api_key: str = None,
+        limits: httpx.Limits = _RERANKER_LIMITS,
     ):
-        super().__init__(base_url=base_url)
+        super().__init__(base_url=base_url, limits=limits)
         self.model = model
         self.api_key = api_key
-        self.headers = {
+        self.headers = httpx.Headers({
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
-        }
+        })
 
     def rerank(self, query: str, documents: List[str]) -> List[Dict[str, Any]]:
         """
@@ -103,6 +229,9 @@ class RerankerClient(SyncHttpClient):
         Returns:
             重排序后的文档列表，包含分数和排名信息
         """
+        if not documents:
+            return []
+
         path = "/rerank"
         payload = {
             "model": self.model,
@@ -110,8 +239,8 @@ class RerankerClient(SyncHttpClient):
             "documents": documents
         }
         
-        response = self._post(path, json=payload, headers=self.headers)
-        logger.debug(f"rerank response: {response}")
+        response = self._post(path, json=payload)
+        logger.opt(lazy=True).debug("rerank response: {}", lambda: response)
         
         if response["status"] != 200:
             raise RerankerError(f"Failed to rerank documents: ({response['status']}) {response['error']}")
@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import json
+import math
+import operator
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from loguru import logger
+from agno.embedder.base import Embedder
+
+
+_MISSING = object()
+
+
+class TTLCache:
+    """带过期时间的 LRU 缓存（线程安全）"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else math.inf
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def make_cache_key(**payload: Any) -> str:
+    """根据请求参数生成稳定的缓存键"""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _normalize(vector: List[float]) -> Tuple[float, ...]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return tuple(x / norm for x in vector)
+
+
+@dataclass
+class CacheLookup:
+    """一次缓存查询的结果，未命中时用于回填缓存"""
+    key: str
+    partition: Tuple[Any, ...]
+    query: Optional[str] = None
+    embedding: Optional[Tuple[float, ...]] = None
+    data: Any = None
+    hit: bool = False
+
+
+class ChatCompletionCache:
+    """
+    chat_completion 响应缓存
+
+    - 第一级：按请求参数的 sha256 精确匹配
+    - 第二级（可选，需提供 embedder）：对最后一条用户消息做向量化，
+      与同一分区（model、type_、user_id）内的历史问题计算余弦相似度，
+      超过阈值即视为命中
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = 3600,
+        *,
+        embedder: Optional[Embedder] = None,
+        similarity_threshold: float = 0.92,
+        max_semantic_entries: int = 256,
+    ):
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self.max_semantic_entries = max_semantic_entries
+        self._exact = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._semantic = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.stats: Dict[str, int] = {"exact_hit": 0, "semantic_hit": 0, "miss": 0}
+
+    async def lookup(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        type_: str,
+        user_id: Optional[str] = None,
+    ) -> CacheLookup:
+        partition = (model, type_, user_id)
+        lookup = CacheLookup(
+            key=make_cache_key(model=model, messages=messages, type_=type_, user_id=user_id),
+            partition=partition,
+        )
+
+        data = self._exact.get(lookup.key, _MISSING)
+        if data is not _MISSING:
+            self.stats["exact_hit"] += 1
+            lookup.data, lookup.hit = data, True
+            return lookup
+
+        if self.embedder is not None:
+            lookup.query = next(
+                (m.get("content") for m in reversed(messages) if m.get("role") == "user"), None
+            )
+            if lookup.query:
+                embedding = await asyncio.to_thread(self.embedder.get_embedding, lookup.query)
+                lookup.embedding = _normalize(embedding)
+                data = self._search(partition, lookup.embedding)
+                if data is not _MISSING:
+                    self.stats["semantic_hit"] += 1
+                    lookup.data, lookup.hit = data, True
+                    return lookup
+
+        self.stats["miss"] += 1
+        return lookup
+
+    def store(self, lookup: CacheLookup, data: Any) -> None:
+        self._exact.set(lookup.key, data)
+        if lookup.embedding is not None:
+            entries = self._semantic.get(lookup.partition) or []
+            entries = [*entries[-(self.max_semantic_entries - 1):], (lookup.embedding, data)]
+            self._semantic.set(lookup.partition, entries)
+
+    def clear(self) -> None:
+        self._exact.clear()
+        self._semantic.clear()
+
+    def _search(self, partition: Tuple[Any, ...], embedding: Tuple[float, ...]) -> Any:
+        best_score, best_data = -1.0, _MISSING
+        for vector, data in self._semantic.get(partition) or ():
+            score = sum(map(operator.mul, vector, embedding))
+            if score > best_score:
+                best_score, best_data = score, data
+        if best_score >= self.similarity_threshold:
+            logger.debug(f"semantic cache hit, similarity: {best_score:.4f}")
+            return best_data
+        return _MISSING
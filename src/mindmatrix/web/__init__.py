@@ -8,11 +8,13 @@ from ._contextvars import (
 )
 from ._endpoints import router
 from ._app import create_app, AgentProvider, MemoryProvider
-from ._security import get_api_key
+from ._server import run_server
+from ._security import get_api_key, reload_api_keys
 from ._openai_adapter import OpenAIAdapter, ChatCompletionRequest
 
 __all__ = [
     "create_app",
+    "run_server",
     "router",
     "AgentProvider",
     "MemoryProvider",
@@ -23,6 +25,7 @@ __all__ = [
     "get_current_workflow",
     "set_current_workflow",
     "get_api_key",
+    "reload_api_keys",
     "OpenAIAdapter",
     "ChatCompletionRequest",
 ]
\ No newline at end of file
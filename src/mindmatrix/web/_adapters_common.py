@@ -0,0 +1,27 @@
+from typing import List
+
+from fastapi import HTTPException
+from agno.run.response import RunResponseContentEvent
+
+from ._models import Message, last_user_message
+
+
+# workflow 事件流中需要转发的内容事件类型，模块加载时取一次
+CONTENT_EVENT = RunResponseContentEvent.event
+
+
+def extract_user_message(messages: List[Message]) -> str:
+    """
+    从请求消息中提取最后一条用户消息
+
+    Raises:
+        HTTPException: 没有消息或没有用户消息时返回 400
+    """
+    if not messages:
+        raise HTTPException(status_code=400, detail="No messages provided")
+
+    user_message = last_user_message(messages)
+    if not user_message:
+        raise HTTPException(status_code=400, detail="No user message found")
+
+    return user_message
@@ -1,16 +1,27 @@
-from typing import Literal
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Dict, Hashable, Iterator, Literal, Optional
 
 from loguru import logger
-from fastapi.responses import JSONResponse
 from fastapi import FastAPI, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
 
 from ._endpoints import router as api_router
+from ._responses import ORJSONResponse
+from ._server import is_uvloop_running
+from ..utils.response_cache import TTLCache
 
 
 class AgentProvider:
-    def __init__(self, mindmatrix):
+    def __init__(self, mindmatrix, cache_size: int = 0, cache_ttl: Optional[float] = 1800):
+        """
+        Args:
+            mindmatrix: MindMatrix 实例
+            cache_size: 按会话缓存已创建的 agent / workflow 的数量，为 0 时不缓存（默认）。
+                只对通过 lease 取用且携带 session_id 的调用生效，同一会话的后续请求复用实例，跳过重复构建
+            cache_ttl: 缓存的有效期（秒），为 None 时不过期
+        """
         self.mindmatrix = mindmatrix
+        self._cache = TTLCache(maxsize=cache_size, ttl=cache_ttl) if cache_size > 0 else None
 
     def __call__(
         self,
@@ -18,6 +29,43 @@ class AgentProvider:
         type_: Literal["agent", "workflow"] = "agent",
         **kwargs,
     ):
+        return self._build(agent_name, type_, **kwargs)
+
+    @contextmanager
+    def lease(
+        self,
+        agent_name: str,
+        type_: Literal["agent", "workflow"] = "agent",
+        **kwargs,
+    ) -> Iterator[Any]:
+        """
+        独占地使用一个 agent / workflow 实例，使用完毕后放回缓存
+
+        实例带有运行状态，不能被并发请求共享：取用时从缓存中移出，同一会话的并发请求取不到缓存，
+        各自构建新实例；未开启缓存或未携带 session_id 时每次构建新实例
+        """
+        key = self._cache_key(agent_name, type_, kwargs)
+        handler = self._cache.pop(key) if key is not None else None
+        if handler is None:
+            handler = self._build(agent_name, type_, **kwargs)
+        try:
+            yield handler
+        finally:
+            if key is not None:
+                self._cache.set(key, handler)
+
+    def _cache_key(self, agent_name: str, type_: str, kwargs: Dict[str, Any]) -> Optional[Hashable]:
+        # 未携带 session_id 的调用可能来自不同会话，不共享实例
+        if self._cache is None or kwargs.get("session_id") is None:
+            return None
+        key = (agent_name, type_, frozenset(kwargs.items()))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def _build(self, agent_name: str, type_: str, **kwargs):
         if type_ == "agent":
             return self.mindmatrix.get_agent(agent_name, **kwargs)
         elif type_ == "workflow":
@@ -37,12 +85,22 @@ class MemoryProvider:
         return self.mindmatrix.memory
 
 
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    if not is_uvloop_running():
+        logger.warning("当前未使用 uvloop 事件循环，建议安装 uvicorn[standard] 并通过 run_server 启动以获得更好的性能")
+    # HTTP 连接池由 utils.http_pool 按事件循环 / 进程共享，不属于本应用，关闭时不在这里释放
+    yield
+
+
 def create_app(agent_provider: AgentProvider, memory_provider: MemoryProvider):
     """Create the FastAPI app and include the router."""
     app = FastAPI(
         title="mindmatrix",
         description="A FastAPI app for mindmatrix",
         version="0.0.1",
+        lifespan=lifespan,
+        default_response_class=ORJSONResponse,
     )
 
     origins = [
@@ -59,16 +117,19 @@ def create_app(agent_provider: AgentProvider, memory_provider: MemoryProvider):
     @app.exception_handler(Exception)
     async def catch_exceptions_middleware(_request: Request, exc: Exception):
         # logger.exception(exc)
-        return JSONResponse(
+        return ORJSONResponse(
             content={"error": f"An unexpected error occurred: {str(exc)}"}, status_code=500
         )
 
     @app.get('/health')
     def get_health():
-        return JSONResponse(content={"status": "OK"})
+        return ORJSONResponse(content={"status": "OK"})
     
     logger.debug(f"setting router agent_provider: {agent_provider}")
     logger.debug(f"setting router memory_provider: {memory_provider}")
+    # 接口通过依赖注入从 app.state 获取 provider，router 上的属性保留给自行挂载 router 的应用
+    app.state.agent_provider = agent_provider
+    app.state.memory_provider = memory_provider
     api_router.agent_provider = agent_provider
     api_router.memory_provider = memory_provider
     app.include_router(router=api_router)
@@ -2,6 +2,8 @@ import contextvars
 
 from loguru import logger
 
+from ._security import _mask
+
 # 创建上下文变量
 session_id_var = contextvars.ContextVar("session_id", default=None)
 jwt_token_var = contextvars.ContextVar("jwt_token", default=None)
@@ -27,7 +29,7 @@ def set_current_jwt_token(token: str):
     Args:
         token: JWT token 字符串
     """
-    logger.debug(f"set current jwt token: {token}")
+    logger.opt(lazy=True).debug("set current jwt token: {}", lambda: _mask(token))
     jwt_token_var.set(token)
 
 
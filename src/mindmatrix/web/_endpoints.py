@@ -1,28 +1,99 @@
-import uuid
-from typing import Literal, Optional
+import asyncio
+import secrets
+from typing import Any, Literal, Optional
 
 from loguru import logger
-from pydantic import BaseModel, Field
-from fastapi import APIRouter, Request
+from pydantic import BaseModel, Field, ValidationError
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.exceptions import RequestValidationError
+from starlette.requests import HTTPConnection
 from agno.memory.v2.schema import UserMemory
 from sse_starlette.sse import EventSourceResponse
 
 from ._contextvars import set_current_workflow
-from ._sse_adapter import SSEAdapter, ChatCompletionRequest as SSEChatCompletionRequest
-from ._openai_adapter import OpenAIAdapter, ChatCompletionRequest as OpenAIChatCompletionRequest
+from ._responses import ORJSONResponse
+from ._sse_adapter import SSEAdapter
+from ._openai_adapter import OpenAIAdapter
+from ._models import (
+    ChatCompletionRequest as OpenAIChatCompletionRequest,
+    BatchChatCompletionRequest,
+    SSEChatCompletionRequest,
+)
 
 
 router = APIRouter(prefix='/mm/v1')
 
 
+def get_agent_provider(request: HTTPConnection) -> Any:
+    """从应用状态中获取 agent_provider（由 create_app 设置）"""
+    provider = getattr(request.app.state, "agent_provider", None)
+    return provider if provider is not None else router.agent_provider
+
+
+def get_memory_provider(request: Request) -> Any:
+    """从应用状态中获取 memory_provider（由 create_app 设置）"""
+    provider = getattr(request.app.state, "memory_provider", None)
+    return provider if provider is not None else router.memory_provider
+
+
+def json_body(model: type[BaseModel]):
+    """
+    直接由 pydantic-core 解析并校验原始请求体，省去 FastAPI 先 `json.loads` 再校验的两次遍历
+
+    Args:
+        model: 请求体模型
+
+    Returns:
+        可用于 `Depends` 的依赖函数，校验失败时与 FastAPI 一样返回 422
+    """
+    async def parse(request: Request) -> BaseModel:
+        try:
+            return model.model_validate_json(await request.body())
+        except ValidationError as exc:
+            raise RequestValidationError(
+                [{**error, "loc": ("body", *error["loc"])} for error in exc.errors(include_url=False)]
+            )
+    return parse
+
+
+def _inline_refs(schema: Any, defs: dict) -> Any:
+    if isinstance(schema, dict):
+        ref = schema.get("$ref")
+        if ref is not None and ref.startswith("#/$defs/"):
+            return _inline_refs(defs[ref[len("#/$defs/"):]], defs)
+        return {key: _inline_refs(value, defs) for key, value in schema.items()}
+    if isinstance(schema, list):
+        return [_inline_refs(item, defs) for item in schema]
+    return schema
+
+
+def json_body_openapi(model: type[BaseModel]) -> dict:
+    """为使用 `json_body` 的接口补充 OpenAPI 请求体描述"""
+    schema = model.model_json_schema()
+    # 嵌套模型的 $defs 在 OpenAPI 文档中无法按 "#/$defs/..." 解析，展开为内联定义
+    defs = schema.pop("$defs", {})
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _inline_refs(schema, defs)}},
+        }
+    }
+
+
 class MemoryCreateRequest(BaseModel):
     memory: str = Field(description="记忆内容")
     topics: Optional[list[str]] = Field(default=[], description="记忆主题")
 
 
-@router.post("/agent/chat/completions")
+@router.post(
+    "/agent/chat/completions",
+    response_model=None,
+    response_class=ORJSONResponse,
+    openapi_extra=json_body_openapi(OpenAIChatCompletionRequest),
+)
 async def chat_completions(
-    input: OpenAIChatCompletionRequest,
+    input: OpenAIChatCompletionRequest = Depends(json_body(OpenAIChatCompletionRequest)),
+    agent_provider=Depends(get_agent_provider),
 ):
     """
     智能体聊天接口，支持标准聊天对话。
@@ -102,13 +173,19 @@ async def chat_completions(
         print(result["choices"][0]["message"]["content"])
     ```
     """
-    agent = router.agent_provider(input.model)
+    agent = agent_provider(input.model)
     return await OpenAIAdapter.handle_chat_request(agent, input)
 
 
-@router.post("/workflow/chat/completions")
+@router.post(
+    "/workflow/chat/completions",
+    response_model=None,
+    response_class=ORJSONResponse,
+    openapi_extra=json_body_openapi(OpenAIChatCompletionRequest),
+)
 async def workflow_chat_completions(
-    input: OpenAIChatCompletionRequest,
+    input: OpenAIChatCompletionRequest = Depends(json_body(OpenAIChatCompletionRequest)),
+    agent_provider=Depends(get_agent_provider),
 ):
     """
     工作流聊天接口，支持复杂工作流对话。
@@ -188,16 +265,92 @@ async def workflow_chat_completions(
         print(result["choices"][0]["message"]["content"])
     ```
     """
-    workflow = router.agent_provider(input.model, type_="workflow")
+    workflow = agent_provider(input.model, type_="workflow")
     set_current_workflow(workflow)
     return await OpenAIAdapter.handle_workflow_chat_request(workflow, input)
 
 
-@router.post("/sse/{type}/chat/completions")
+@router.post(
+    "/{type}/chat/completions/batch",
+    response_model=None,
+    openapi_extra=json_body_openapi(BatchChatCompletionRequest),
+)
+async def batch_chat_completions(
+    type: Literal["agent", "workflow"],
+    input: BatchChatCompletionRequest = Depends(json_body(BatchChatCompletionRequest)),
+    agent_provider=Depends(get_agent_provider),
+):
+    """
+    批量聊天接口，一次请求处理多组对话。
+
+    ## 功能描述
+    此接口将多组对话合并为一次HTTP请求，服务端并发执行每组对话，并按请求顺序返回结果。
+    客户端 `AsyncMindMatrixClient` 开启批量模式后会自动合并并发的非流式请求并调用此接口。
+
+    ## 请求参数
+
+    ### Path Parameters
+    - type: 类型，值为 "agent" 或 "workflow"
+
+    ### Body
+    ```json
+    {
+        "model": "string",  # 智能体或工作流名称
+        "messages_list": [
+            [{"role": "user", "content": "string"}],  # 第一组对话
+            [{"role": "user", "content": "string"}]   # 第二组对话
+        ]
+    }
+    ```
+
+    ## 响应说明
+    ### 成功响应 (200 OK)
+    ```json
+    {
+        "responses": [
+            {"id": "string", "object": "chat.completion", "choices": [...]},  # 与非流式聊天接口的响应一致
+            {"error": "string"}  # 某组对话执行失败时返回错误信息
+        ]
+    }
+    ```
+
+    ### 错误响应
+    - 400 Bad Request: 请求参数无效
+    - 500 Internal Server Error: 服务器内部错误
+    """
+    async def run(messages):
+        request = OpenAIChatCompletionRequest(
+            model=input.model,
+            messages=messages,
+            temperature=input.temperature,
+            max_tokens=input.max_tokens,
+        )
+        handler = agent_provider(input.model, type_=type)
+        if type == "workflow":
+            set_current_workflow(handler)
+        return await OpenAIAdapter.complete(handler, request)
+
+    results = await asyncio.gather(*(run(messages) for messages in input.messages_list), return_exceptions=True)
+    responses = []
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"batch chat completion failed: {result}")
+            responses.append({"error": str(result)})
+        else:
+            responses.append(result)
+    return {"responses": responses}
+
+
+@router.post(
+    "/sse/{type}/chat/completions",
+    response_model=None,
+    openapi_extra=json_body_openapi(SSEChatCompletionRequest),
+)
 async def sse_chat_completions(
     request: Request,
-    input: SSEChatCompletionRequest,
     type: Literal["agent", "workflow"],
+    input: SSEChatCompletionRequest = Depends(json_body(SSEChatCompletionRequest)),
+    agent_provider=Depends(get_agent_provider),
 ):
     """
     智能聊天接口，支持流式响应和会话管理。
@@ -253,7 +406,7 @@ async def sse_chat_completions(
 
     ### 调用示例代码
     ```python
-    import json
+    import orjson
     import httpx
     from sse_starlette.sse import aconnect_sse
 
@@ -279,40 +432,132 @@ async def sse_chat_completions(
                 
                 try:
                     if sse.event == "stream":
-                        chunk = json.loads(sse.data)
+                        chunk = orjson.loads(sse.data)
                         ... # 处理流式响应
                     elif sse.event == "artifact":
                         ... # 处理结构化数据响应
-                except json.JSONDecodeError as e:
+                except orjson.JSONDecodeError as e:
                     logger.warning(f"无法解析JSON数据: {sse.data}")
                     logger.exception(e)
                     ... # 处理错误响应
     ```
     """
-    logger.debug(f"Received request: {input}")
+    logger.opt(lazy=True).debug("Received request: {}", lambda: input)
 
     # 如果session_id为空，则生成一个新的session_id
-    session_id = input.session_id or str(uuid.uuid4())
+    session_id = input.session_id or secrets.token_hex(16)
+
+    async def sse_event_generator():
+        # 根据type参数获取对应的agent或workflow，响应结束前独占该实例
+        with agent_provider.lease(
+            input.model,
+            type_=type,
+            user_id=input.user_id,
+            session_id=session_id,
+        ) as handler:
+            if type == "workflow":
+                set_current_workflow(handler)
+            events = SSEAdapter.handle_chat_request(request, handler, input, type=type)
+            try:
+                async for event in events:
+                    yield event
+            finally:
+                await events.aclose()
+
+    return EventSourceResponse(sse_event_generator())
+
+
+@router.websocket("/ws/{type}/chat/completions")
+async def ws_chat_completions(
+    websocket: WebSocket,
+    type: Literal["agent", "workflow"],
+    agent_provider=Depends(get_agent_provider),
+):
+    """
+    智能聊天接口的 WebSocket 版本，事件内容与 SSE 接口一致，省去每个事件的 HTTP 分块与 SSE 文本帧开销。
+
+    ## 协议
+    1. 建立连接后，客户端发送一条 JSON 消息，格式与 SSE 接口的请求体相同
+    2. 服务端以二进制帧逐个推送事件：`{"event": "stream" | "artifact", "data": {...}}`
+    3. 响应结束后服务端正常关闭连接（code 1000）；请求体无效时以 code 1007 关闭，
+       请求内容不符合要求（如没有用户消息）时以 code 1008 关闭，reason 为错误信息
+
+    ### 调用示例代码
+    ```python
+    import orjson
+    import websockets
+
+    url = "<server endpoint>/mm/v1/ws/agent/chat/completions"
+    payload = {
+        "model": <model_name>,
+        "messages": [{"role": "user", "content": "你好"}],
+        "stream": True,
+    }
 
-    # 根据type参数获取对应的agent或workflow
-    handler = router.agent_provider(
+    async with websockets.connect(url) as ws:
+        await ws.send(orjson.dumps(payload).decode())
+        async for message in ws:
+            event = orjson.loads(message)
+            if event["event"] == "stream":
+                ... # 处理流式响应
+            elif event["event"] == "artifact":
+                ... # 处理结构化数据响应
+    ```
+    """
+    await websocket.accept()
+    try:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        input = SSEChatCompletionRequest.model_validate_json(message.get("bytes") or message.get("text") or b"")
+    except ValidationError as exc:
+        logger.warning(f"invalid websocket request: {exc}")
+        await websocket.close(code=status.WS_1007_INVALID_FRAME_PAYLOAD_DATA, reason="invalid request body")
+        return
+    logger.opt(lazy=True).debug("Received websocket request: {}", lambda: input)
+
+    # HTTPException 在 WebSocket 中不会转换为响应，先校验消息，不符合要求时带原因关闭连接
+    try:
+        SSEAdapter.extract_user_message(input)
+    except HTTPException as exc:
+        logger.warning("invalid websocket request: {}", exc.detail)
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(exc.detail))
+        return
+
+    session_id = input.session_id or secrets.token_hex(16)
+    # 连接结束前独占该实例
+    with agent_provider.lease(
         input.model,
         type_=type,
         user_id=input.user_id,
         session_id=session_id,
-    )
-
-    if type == "workflow":
-        set_current_workflow(handler)
-
-    sse_event_generator = SSEAdapter.handle_chat_request(request, handler, input, type=type)
-    
-    return EventSourceResponse(sse_event_generator)
-
-
-@router.get("/memory/{user_id}/memories")
+    ) as handler:
+        if type == "workflow":
+            set_current_workflow(handler)
+
+        events = SSEAdapter.handle_chat_request(None, handler, input, type=type)
+        try:
+            async for event in events:
+                # 事件 data 已是 JSON 文本，直接拼接为帧，不再重复序列化
+                await websocket.send_bytes(
+                    b'{"event":"' + event.event.encode() + b'","data":' + event.data.encode() + b"}"
+                )
+        except WebSocketDisconnect:
+            logger.warning("客户端已断开连接...")
+            return
+        except HTTPException as exc:
+            logger.warning("websocket chat request failed: {}", exc.detail)
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(exc.detail))
+            return
+        finally:
+            await events.aclose()
+    await websocket.close()
+
+
+@router.get("/memory/{user_id}/memories", response_model=None, response_class=ORJSONResponse)
 async def get_memories(
     user_id: str,
+    memory_provider=Depends(get_memory_provider),
 ):
     """
     获取用户记忆列表接口
@@ -382,15 +627,22 @@ async def get_memories(
             print(f"主题: {memory['topics']}")
     ```
     """
-    memory = router.memory_provider()
+    memory = memory_provider()
     assert memory is not None, "Memory is not set"
-    return memory.get_user_memories(user_id=user_id)
+    # UserMemory 为 dataclass，orjson 可直接序列化，无需经过 jsonable_encoder
+    return ORJSONResponse(memory.get_user_memories(user_id=user_id))
 
 
-@router.post("/memory/{user_id}/memories")
+@router.post(
+    "/memory/{user_id}/memories",
+    response_model=None,
+    response_class=ORJSONResponse,
+    openapi_extra=json_body_openapi(MemoryCreateRequest),
+)
 async def add_memory(
     user_id: str,
-    input: MemoryCreateRequest,
+    input: MemoryCreateRequest = Depends(json_body(MemoryCreateRequest)),
+    memory_provider=Depends(get_memory_provider),
 ):
     """
     添加用户记忆接口。
@@ -450,7 +702,7 @@ async def add_memory(
         print(f"记忆内容: {result['memory']}")
     ```
     """
-    memory = router.memory_provider()
+    memory = memory_provider()
     assert memory is not None, "Memory is not set"
     memory_id = memory.add_user_memory(
         user_id=user_id, 
@@ -459,16 +711,17 @@ async def add_memory(
             topics=input.topics,
         ),
     )
-    return {
+    return ORJSONResponse({
         "memory_id": memory_id,
         "memory": input.memory,
         "topics": input.topics,
-    }
+    })
 
-@router.delete("/memory/{user_id}/memories/{memory_id}")
+@router.delete("/memory/{user_id}/memories/{memory_id}", response_model=None, response_class=ORJSONResponse)
 async def delete_memory(
     user_id: str,
     memory_id: str,
+    memory_provider=Depends(get_memory_provider),
 ):
     """
     删除指定用户的指定记忆
@@ -495,6 +748,6 @@ async def delete_memory(
     DELETE /mm/v1/memory/jane_doe@example.com/memories/memory_123
     ```
     """
-    memory = router.memory_provider()
+    memory = memory_provider()
     assert memory is not None, "Memory is not set"
-    return memory.delete_user_memory(user_id=user_id, memory_id=memory_id)
+    return ORJSONResponse(memory.delete_user_memory(user_id=user_id, memory_id=memory_id))
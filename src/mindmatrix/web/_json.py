@@ -0,0 +1,39 @@
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+
+import orjson
+from pydantic import BaseModel
+
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj: Any) -> Any:
+    """orjson 无法直接序列化的类型"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, UUID):
+        return str(obj)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).decode("utf-8")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    使用 orjson 序列化为 JSON bytes
+
+    支持 pydantic 模型、Decimal、日期时间、UUID、bytes、numpy 数组，以及非字符串类型的键。
+    """
+    return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+
+def loads(data: Any) -> Any:
+    """使用 orjson 解析 JSON（bytes / str）"""
+    return orjson.loads(data)
@@ -0,0 +1,59 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class Message(BaseModel):
+    role: str = Field(..., description="消息发送者的角色，例如 'user' 或 'assistant'")
+    content: str = Field(..., description="消息的内容")
+    name: Optional[str] = Field(None, description="消息发送者的名称")
+
+
+def last_user_message(messages: List[Message]) -> Optional[str]:
+    """返回最后一条用户消息的内容，没有用户消息时返回 None"""
+    return next((message.content for message in reversed(messages) if message.role == "user"), None)
+
+
+class ChatCompletionRequest(BaseModel):
+    """OpenAI 兼容接口的请求体"""
+    model: str = Field(default="deepseek-v3")
+    messages: List[Message]
+    temperature: Optional[float] = Field(default=0.7)
+    stream: Optional[bool] = Field(default=False)
+    max_tokens: Optional[int] = Field(default=None)
+
+
+class BatchChatCompletionRequest(BaseModel):
+    model: str = Field(default="deepseek-v3")
+    messages_list: List[List[Message]]
+    temperature: Optional[float] = Field(default=0.7)
+    max_tokens: Optional[int] = Field(default=None)
+
+
+class SSEChatCompletionRequest(BaseModel):
+    """SSE 接口的请求体"""
+    user_id: Optional[str] = Field(None, description="用户ID")
+    session_id: Optional[str] = Field(None, description="可选的会话ID, 传入已有会话ID则继续对话, 否则生成新的会话ID")
+    model: str = Field(..., description="模型名称")
+    messages: List[Message] = Field(..., description="聊天消息的列表")
+    stream: Optional[bool] = Field(False, description="可选的布尔值，指示是否流式传输响应")
+
+
+class DeltaMessage(BaseModel):
+    role: Optional[str] = None
+    content: Optional[str] = None
+
+
+class ChatCompletionResponseChoice(BaseModel):
+    index: int
+    message: Optional[Message] = None
+    delta: Optional[DeltaMessage] = None
+    finish_reason: Optional[str] = None
+
+
+class ChatCompletionResponse(BaseModel):
+    id: str
+    object: str
+    created: int
+    model: str
+    choices: List[ChatCompletionResponseChoice]
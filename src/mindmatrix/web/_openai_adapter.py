@@ -1,49 +1,68 @@
-import json
-import asyncio
-from typing import AsyncGenerator, AsyncIterator,List, Optional, Union
+import time
+from typing import Any, AsyncGenerator, Dict, Tuple, Union
 
 from loguru import logger
-from pydantic import BaseModel, Field
-from fastapi import HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from agno.agent import Agent, RunResponse
 from agno.workflow.v2.workflow import Workflow
-from agno.run.response import RunResponseContentEvent
-from agno.run.v2.workflow import WorkflowRunResponseEvent
 
+from ._adapters_common import CONTENT_EVENT, extract_user_message
+from ._json import dumps
+from ._responses import ORJSONResponse
+from ._streaming import coalesce
+from ._models import (
+    Message,
+    ChatCompletionRequest,
+    DeltaMessage,
+    ChatCompletionResponseChoice,
+    ChatCompletionResponse,
+)
+
+
+# 请求与响应模型定义在 _models 中，这里重新导出以兼容原有的导入路径
+__all__ = [
+    "OpenAIAdapter",
+    "Message",
+    "ChatCompletionRequest",
+    "DeltaMessage",
+    "ChatCompletionResponseChoice",
+    "ChatCompletionResponse",
+]
+
+
+# 流式响应的媒体类型与响应头：生成器已产出 bytes，显式声明字符集；
+# 关闭缓存与反向代理（如 nginx）缓冲，使每个事件立即下发
+_SSE_MEDIA_TYPE = "text/event-stream; charset=utf-8"
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def _content_chunk_template(chunk_id: str, created: int, model: str) -> Tuple[bytes, bytes]:
+    """
+    流式内容事件的前后缀字节：同一个流中只有 content 变化，逐 token 只需序列化 content
 
-class Message(BaseModel):
-    role: str
-    content: str
-    name: Optional[str] = None
-
-
-class ChatCompletionRequest(BaseModel):
-    model: str = Field(default="deepseek-v3")
-    messages: List[Message]
-    temperature: Optional[float] = Field(default=0.7)
-    stream: Optional[bool] = Field(default=False)
-    max_tokens: Optional[int] = Field(default=None)
-
-    
-class DeltaMessage(BaseModel):
-    role: Optional[str] = None
-    content: Optional[str] = None
+    Returns:
+        (prefix, suffix)，`prefix + dumps(content) + suffix` 即为完整的 SSE 事件
+    """
+    prefix = (
+        b'data: {"id":' + dumps(chunk_id)
+        + b',"object":"chat.completion.chunk","created":' + dumps(created)
+        + b',"model":' + dumps(model)
+        + b',"choices":[{"index":0,"delta":{"content":'
+    )
+    return prefix, b'},"finish_reason":null}]}\n\n'
 
 
-class ChatCompletionResponseChoice(BaseModel):
-    index: int
-    message: Optional[Message] = None
-    delta: Optional[DeltaMessage] = None
-    finish_reason: Optional[str] = None
+# 流结束标记
+_DONE = b"data: [DONE]\n\n"
+# 错误事件只有 created 与错误信息变化，其余部分预先编码
+_ERROR_HEAD = b'data: {"id":"chatcmpl-error","object":"chat.completion.chunk","created":'
+_ERROR_BODY = b',"model":"deepseek-v3","choices":[{"index":0,"delta":{"content":"Error: '
+_ERROR_TAIL = b'"},"finish_reason":"error"}]}\n\n'
 
 
-class ChatCompletionResponse(BaseModel):
-    id: str
-    object: str
-    created: int
-    model: str
-    choices: List[ChatCompletionResponseChoice]
+def _error_chunk(created: int, error: Exception) -> bytes:
+    """流式错误事件，错误信息经 JSON 转义后直接拼入模板"""
+    return _ERROR_HEAD + dumps(created) + _ERROR_BODY + dumps(str(error))[1:-1] + _ERROR_TAIL
 
 
 class OpenAIAdapter:
@@ -54,55 +73,74 @@ class OpenAIAdapter:
     @staticmethod
     def extract_user_message(request: ChatCompletionRequest) -> str:
         """从OpenAI请求中提取用户消息"""
-        messages = request.messages
-        if not messages:
-            raise HTTPException(status_code=400, detail="No messages provided")
-        
-        # 获取用户的最后一条消息
-        user_message = None
-        for msg in reversed(messages):
-            if msg.role == "user":
-                user_message = msg.content
-                break
-        
-        if not user_message:
-            raise HTTPException(status_code=400, detail="No user message found")
-            
-        return user_message
+        return extract_user_message(request.messages)
 
     @staticmethod
     def create_completion_response(response: RunResponse, model: str) -> ChatCompletionResponse:
-        """创建非流式响应"""
-        return ChatCompletionResponse(
-            id=f"chatcmpl-{id(response)}",
-            object="chat.completion",
-            created=int(asyncio.get_event_loop().time()),
-            model=model,
-            choices=[
-                ChatCompletionResponseChoice(
-                    index=0,
-                    message=Message(
-                        role="assistant",
-                        content=response.get_content_as_string(by_alias=True)
-                    ),
-                    finish_reason="stop"
-                )
-            ]
-        )
+        """创建非流式响应模型，内容与 `completion_payload` 一致"""
+        return ChatCompletionResponse.model_validate(OpenAIAdapter.completion_payload(response, model))
+
+    @staticmethod
+    def completion_payload(response: RunResponse, model: str) -> Dict[str, Any]:
+        """创建非流式响应体，直接由 orjson 序列化"""
+        return {
+            "id": f"chatcmpl-{id(response)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": response.get_content_as_string(by_alias=True),
+                        "name": None,
+                    },
+                    "delta": None,
+                    "finish_reason": "stop",
+                }
+            ],
+        }
+
+    @staticmethod
+    async def complete(handler: Union[Agent, Workflow], request: ChatCompletionRequest) -> Dict[str, Any]:
+        """非流式执行 agent / workflow，返回 OpenAI 格式的响应体"""
+        user_message = OpenAIAdapter.extract_user_message(request)
+        response = await handler.arun(user_message)
+        return OpenAIAdapter.completion_payload(response, request.model)
+
+    @staticmethod
+    def stream_response(agent: Agent, message: str) -> AsyncGenerator[bytes, None]:
+        """生成与OpenAI兼容的流式响应"""
+        return OpenAIAdapter._stream(agent, message, workflow=False)
 
     @staticmethod
-    async def stream_response(agent: Agent, message: str) -> AsyncGenerator[str, None]:
+    def stream_workflow_response(workflow: Workflow, message: str) -> AsyncGenerator[bytes, None]:
         """生成与OpenAI兼容的流式响应"""
-        logger.debug(f"Starting stream response for message: {message}")
+        return OpenAIAdapter._stream(workflow, message, workflow=True)
+
+    @staticmethod
+    async def _stream(handler: Union[Agent, Workflow], message: str, workflow: bool) -> AsyncGenerator[bytes, None]:
+        """
+        agent / workflow 共用的流式响应生成器
+
+        Args:
+            handler: Agent或Workflow实例
+            message: 用户消息
+            workflow: 是否为 workflow；workflow 只转发内容事件
+        """
+        logger.debug("Starting stream response for message: {}", message)
+        # created 只在流开始时取一次，错误事件也复用
+        created_time = int(time.time())
 
         try:
-            # 使用agent生成流式响应
-            async_response = await agent.arun(message, stream=True)
-            logger.debug("Agent response obtained, starting streaming")
+            # 使用agent / workflow生成流式响应
+            async_response = await handler.arun(message, stream=True)
+            logger.debug("Response obtained, starting streaming")
             
             # 生成与OpenAI兼容的事件流
             chunk_id = f"chatcmpl-{id(async_response)}"
-            created_time = int(asyncio.get_event_loop().time())
+            content_prefix, content_suffix = _content_chunk_template(chunk_id, created_time, "deepseek-v3")
             
             # 发送开始事件
             first_chunk = {
@@ -118,32 +156,23 @@ class OpenAIAdapter:
                     }
                 ]
             }
-            yield f"data: {json.dumps(first_chunk)}\n\n"
+            yield b"data: " + dumps(first_chunk) + b"\n\n"
             
             # 迭代流式响应内容
+            # 逐 token 调用的函数预先绑定为局部变量，循环内不再查找全局名称
+            encode, debug, content_event = dumps, logger.debug, CONTENT_EVENT
             async for response_delta in async_response:
-                content = response_delta.content if hasattr(response_delta, 'content') else ""
-                try:
-                    logger.debug(f"Processing delta content: {content}")
-                except UnicodeEncodeError:
-                    # 对于可能包含emoji的内容，使用更安全的记录方式
-                    logger.debug(f"Processing delta content: {repr(content)}")
+                if workflow:
+                    if response_delta.event != content_event:
+                        continue
+                    content = response_delta.content
+                else:
+                    content = getattr(response_delta, "content", None)
+                # 参数形式由 loguru 按需格式化，未启用 DEBUG 时不构造字符串；repr 避免 emoji 编码问题
+                debug("Processing delta content: {!r}", content)
                 
                 if content:
-                    chunk = {
-                        "id": chunk_id,
-                        "object": "chat.completion.chunk",
-                        "created": created_time,
-                        "model": "deepseek-v3",
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {"content": content},
-                                "finish_reason": None
-                            }
-                        ]
-                    }
-                    yield f"data: {json.dumps(chunk)}\n\n"
+                    yield content_prefix + encode(content) + content_suffix
             
             # 发送结束事件
             last_chunk = {
@@ -159,152 +188,40 @@ class OpenAIAdapter:
                     }
                 ]
             }
-            yield f"data: {json.dumps(last_chunk)}\n\n"
+            yield b"data: " + dumps(last_chunk) + b"\n\n"
             
-            yield 'data: [DONE]\n\n'
+            yield _DONE
         
         except Exception as e:
             logger.error(f"Error in stream_response: {str(e)}")
             # 返回错误信息
-            error_chunk = {
-                "id": f"chatcmpl-error",
-                "object": "chat.completion.chunk",
-                "created": int(asyncio.get_event_loop().time()),
-                "model": "deepseek-v3",
-                "choices": [
-                    {
-                        "index": 0,
-                        "delta": {"content": f"Error: {str(e)}"},
-                        "finish_reason": "error"
-                    }
-                ]
-            }
-            yield f"data: {json.dumps(error_chunk)}\n\n"
-            yield 'data: [DONE]\n\n'
+            yield _error_chunk(created_time, e)
+            yield _DONE
 
     @staticmethod
-    async def stream_workflow_response(workflow: Workflow, message: str) -> AsyncGenerator[str, None]:
-        """生成与OpenAI兼容的流式响应"""
-        logger.debug(f"Starting stream response for message: {message}")
-
-        try:
-            # 使用workflow生成流式响应
-            async_response: AsyncIterator[WorkflowRunResponseEvent] = await workflow.arun(message, stream=True)
-            logger.debug("Workflow response obtained, starting streaming")
-            
-            # 生成与OpenAI兼容的事件流
-            chunk_id = f"chatcmpl-{id(async_response)}"
-            created_time = int(asyncio.get_event_loop().time())
-            
-            # 发送开始事件
-            first_chunk = {
-                "id": chunk_id,
-                "object": "chat.completion.chunk",
-                "created": created_time,
-                "model": "deepseek-v3",
-                "choices": [
-                    {
-                        "index": 0,
-                        "delta": {"role": "assistant"},
-                        "finish_reason": None
-                    }
-                ]
-            }
-            yield f"data: {json.dumps(first_chunk)}\n\n"
-            
-            # 迭代流式响应内容
-            async for event in async_response:
-                if event.event == RunResponseContentEvent.event:
-                    content = event.content
-                    try:
-                        logger.debug(f"Processing delta content: {content}")
-                    except UnicodeEncodeError:
-                        # 对于可能包含emoji的内容，使用更安全的记录方式
-                        logger.debug(f"Processing delta content: {repr(content)}")
-                    
-                    if content:
-                        chunk = {
-                            "id": chunk_id,
-                            "object": "chat.completion.chunk",
-                            "created": created_time,
-                            "model": "deepseek-v3",
-                            "choices": [
-                                {
-                                    "index": 0,
-                                    "delta": {"content": content},
-                                    "finish_reason": None
-                                }
-                            ]
-                        }
-                        yield f"data: {json.dumps(chunk)}\n\n"
-            
-            # 发送结束事件
-            last_chunk = {
-                "id": chunk_id,
-                "object": "chat.completion.chunk",
-                "created": created_time,
-                "model": "deepseek-v3",
-                "choices": [
-                    {
-                        "index": 0,
-                        "delta": {},
-                        "finish_reason": "stop"
-                    }
-                ]
-            }
-            yield f"data: {json.dumps(last_chunk)}\n\n"
-            
-            yield 'data: [DONE]\n\n'
-        
-        except Exception as e:
-            logger.error(f"Error in stream_response: {str(e)}")
-            # 返回错误信息
-            error_chunk = {
-                "id": f"chatcmpl-error",
-                "object": "chat.completion.chunk",
-                "created": int(asyncio.get_event_loop().time()),
-                "model": "deepseek-v3",
-                "choices": [
-                    {
-                        "index": 0,
-                        "delta": {"content": f"Error: {str(e)}"},
-                        "finish_reason": "error"
-                    }
-                ]
-            }
-            yield f"data: {json.dumps(error_chunk)}\n\n"
-            yield 'data: [DONE]\n\n'
-            
-    @staticmethod
-    async def handle_chat_request(agent: Agent, request: ChatCompletionRequest) -> Union[ChatCompletionResponse, StreamingResponse]:
+    async def handle_chat_request(agent: Agent, request: ChatCompletionRequest) -> Response:
         """处理聊天请求，返回适当的响应类型"""
-        # 提取用户消息
-        user_message = OpenAIAdapter.extract_user_message(request)
-        
-        # 如果请求流式输出
-        if request.stream:
-            return StreamingResponse(
-                OpenAIAdapter.stream_response(agent, user_message),
-                media_type="text/event-stream"
-            )
-        
-        # 非流式输出
-        response = await agent.arun(user_message)
-        return OpenAIAdapter.create_completion_response(response, request.model)
+        return await OpenAIAdapter._handle(agent, request, workflow=False)
     
     @staticmethod
-    async def handle_workflow_chat_request(workflow: Workflow, request: ChatCompletionRequest) -> Union[ChatCompletionResponse, StreamingResponse]:
+    async def handle_workflow_chat_request(workflow: Workflow, request: ChatCompletionRequest) -> Response:
         """处理聊天请求，返回适当的响应类型"""
+        return await OpenAIAdapter._handle(workflow, request, workflow=True)
+
+    @staticmethod
+    async def _handle(handler: Union[Agent, Workflow], request: ChatCompletionRequest, workflow: bool) -> Response:
+        """agent / workflow 共用的请求处理，流式时返回 SSE 响应，否则返回 JSON 响应"""
         # 提取用户消息
         user_message = OpenAIAdapter.extract_user_message(request)
         
         # 如果请求流式输出
         if request.stream:
             return StreamingResponse(
-                OpenAIAdapter.stream_workflow_response(workflow, user_message),
-                media_type="text/event-stream"
+                coalesce(OpenAIAdapter._stream(handler, user_message, workflow)),
+                media_type=_SSE_MEDIA_TYPE,
+                headers=_SSE_HEADERS,
             )
         
-        # 非流式输出 - 使用异步方法获取RunResponse
-        response = await workflow.arun(user_message)
-        return OpenAIAdapter.create_completion_response(response, request.model)
\ No newline at end of file
+        # 非流式输出
+        response = await handler.arun(user_message)
+        return ORJSONResponse(OpenAIAdapter.completion_payload(response, request.model))
@@ -0,0 +1,12 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+from ._json import dumps
+
+
+class ORJSONResponse(JSONResponse):
+    """使用 orjson 序列化的 JSON 响应，可直接传入 pydantic 模型"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,3 +1,7 @@
+import os
+from functools import lru_cache
+from typing import Optional
+
 from loguru import logger
 from fastapi import HTTPException, Security
 from fastapi.security import APIKeyHeader, HTTPBearer
@@ -5,9 +9,30 @@ from fastapi.security import APIKeyHeader, HTTPBearer
 bearer_scheme = HTTPBearer(auto_error=False)
 
 
+@lru_cache(maxsize=1)
+def _get_api_keys() -> frozenset[str]:
+    """
+    允许访问的 API Key，从环境变量 MINDMATRIX_API_KEYS（逗号分隔）读取
+
+    构建为 frozenset 并缓存，校验时为 O(1) 的哈希查找
+    """
+    return frozenset(
+        key.strip() for key in os.getenv("MINDMATRIX_API_KEYS", "").split(",") if key.strip()
+    )
+
+
+def reload_api_keys() -> None:
+    """重新读取 API Key 配置（如更新环境变量后）"""
+    _get_api_keys.cache_clear()
+
+
+def _mask(secret: Optional[str]) -> Optional[str]:
+    return secret[:4] + "…" if secret else secret
+
+
 async def get_api_key(api_key: str = Security(APIKeyHeader(name='api-key', auto_error=False))):
-    logger.info(f"get api_key: {api_key}")
-    if api_key in settings.server.api_keys:
+    logger.opt(lazy=True).debug("get api_key: {}", lambda: _mask(api_key))
+    if api_key in _get_api_keys():
         return api_key
     else:
         raise HTTPException(status_code=401, detail="Invalid or missing API Key")
@@ -27,5 +52,5 @@ async def get_bearer_token(token: str = Security(bearer_scheme)):
     """
     if not token:
         raise HTTPException(status_code=401, detail="Missing Bearer token")
-    logger.info(f"get bearer token: {token.credentials}")
+    logger.opt(lazy=True).debug("get bearer token: {}", lambda: _mask(token.credentials))
     return token.credentials
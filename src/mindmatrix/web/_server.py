@@ -0,0 +1,50 @@
+import asyncio
+import importlib.util
+from typing import Any
+
+from loguru import logger
+
+
+def _has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def is_uvloop_running() -> bool:
+    """当前事件循环是否为 uvloop"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return type(loop).__module__.startswith("uvloop")
+
+
+def run_server(
+    app: Any,
+    host: str = "127.0.0.1",
+    port: int = 9527,
+    log_level: str = "debug",
+    **kwargs,
+) -> None:
+    """
+    使用 uvicorn 启动 Web 服务
+
+    已安装 uvloop、httptools 时（`pip install "uvicorn[standard]"`）默认使用二者，
+    避免 asyncio 默认事件循环与 h11 在 keep-alive 长连接（如 SSE）下的性能问题。
+    也可以使用 Granian 部署：`granian --interface asgi <module>:app`
+
+    Args:
+        app: ASGI 应用
+        host: 监听地址
+        port: 监听端口
+        log_level: 日志级别
+        **kwargs: 透传给 uvicorn.run 的其他参数，可覆盖默认的 loop、http 等配置
+    """
+    import uvicorn
+
+    kwargs.setdefault("loop", "uvloop" if _has_module("uvloop") else "auto")
+    kwargs.setdefault("http", "httptools" if _has_module("httptools") else "auto")
+    kwargs.setdefault("backlog", 2048)
+    kwargs.setdefault("timeout_keep_alive", 30)
+    logger.info(f"uvicorn loop: {kwargs['loop']}, http: {kwargs['http']}")
+
+    uvicorn.run(app, host=host, port=port, log_level=log_level, **kwargs)
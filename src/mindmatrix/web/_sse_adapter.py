@@ -1,27 +1,82 @@
-import json
-from typing import List, Optional, Dict, Any, AsyncGenerator, Union, Literal, AsyncIterator
+import asyncio
+from typing import List, Optional, Any, AsyncGenerator, Union, Literal, AsyncIterator
 
 from loguru import logger
-from pydantic import BaseModel, Field
-from fastapi import HTTPException, Request
+from pydantic import TypeAdapter
+from fastapi import Request
+from sse_starlette import ServerSentEvent
 from agno.agent import Agent
 from agno.workflow.v2.workflow import Workflow
-from agno.run.response import RunResponseContentEvent
 from agno.run.v2.workflow import WorkflowRunResponseEvent
 
+from ._adapters_common import CONTENT_EVENT, extract_user_message
+from ._json import dumps
+from ._models import Message, SSEChatCompletionRequest as ChatCompletionRequest
 
-class Message(BaseModel):
-    role: str = Field(..., description="消息发送者的角色，例如 'user' 或 'assistant'")
-    content: str = Field(..., description="消息的内容")
-    name: Optional[str] = Field(None, description="消息发送者的名称")
 
+# 将事件中的 artifact 列表一次性转换为可序列化的结构
+_ARTIFACTS_ADAPTER = TypeAdapter(List[Any])
 
-class ChatCompletionRequest(BaseModel):
-    user_id: Optional[str] = Field(None, description="用户ID")
-    session_id: Optional[str] = Field(None, description="可选的会话ID, 传入已有会话ID则继续对话, 否则生成新的会话ID")
-    model: str = Field(..., description="模型名称")
-    messages: List[Message] = Field(..., description="聊天消息的列表")
-    stream: Optional[bool] = Field(False, description="可选的布尔值，指示是否流式传输响应")
+
+# 请求模型定义在 _models 中，这里重新导出以兼容原有的导入路径
+__all__ = ["SSEAdapter", "Message", "ChatCompletionRequest"]
+
+
+def _stream_data(delta: Any) -> str:
+    """stream 事件的 data：`{"delta": ...}` 的 JSON 文本，直接由 orjson 序列化，不逐个 token 构造模型"""
+    return dumps({"delta": delta}).decode()
+
+
+# 检查客户端是否断开的间隔（秒）
+_DISCONNECT_POLL_INTERVAL = 0.2
+
+
+async def _wait_disconnected(request: Request) -> None:
+    """客户端断开连接后返回"""
+    while not await request.is_disconnected():
+        await asyncio.sleep(_DISCONNECT_POLL_INTERVAL)
+
+
+async def _until_disconnected(request: Optional[Request], stream: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    """
+    迭代 agent / workflow 的事件流，客户端断开时立即停止
+
+    断开由独立的任务定时检测，不再逐个事件检查；检测到断开后取消正在等待的上游读取并关闭事件流，
+    取消会传递到上游的模型调用，不再为已断开的客户端继续生成。
+
+    Args:
+        request: FastAPI请求对象，为 None 时不检测断开
+        stream: agent / workflow 返回的异步事件流
+    """
+    iterator = stream.__aiter__()
+    if request is None:
+        async for item in iterator:
+            yield item
+        return
+
+    watcher = asyncio.create_task(_wait_disconnected(request))
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            pending = asyncio.ensure_future(anext(iterator))
+            await asyncio.wait((pending, watcher), return_when=asyncio.FIRST_COMPLETED)
+            if watcher.done():
+                logger.warning("客户端已断开连接...")
+                break
+            try:
+                item = pending.result()
+            except StopAsyncIteration:
+                break
+            pending = None
+            yield item
+    finally:
+        watcher.cancel()
+        if pending is not None and not pending.done():
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
 
 
 class SSEAdapter:
@@ -29,71 +84,50 @@ class SSEAdapter:
     @staticmethod
     def extract_user_message(request: ChatCompletionRequest) -> str:
         """从请求中提取用户消息"""
-        messages = request.messages
-        if not messages:
-            raise HTTPException(status_code=400, detail="No messages provided")
-        
-        # 获取用户的最后一条消息
-        user_message = None
-        for msg in reversed(messages):
-            if msg.role == "user":
-                user_message = msg.content
-                break
-        
-        if not user_message:
-            raise HTTPException(status_code=400, detail="No user message found")
-            
-        return user_message
+        return extract_user_message(request.messages)
 
     @staticmethod
     async def handle_chat_request(
-        request: Request,
+        request: Optional[Request],
         handler: Union[Agent, Workflow],
         input: ChatCompletionRequest,
         type: Literal["agent", "workflow"] = "agent",
-    ) -> AsyncGenerator[Dict[str, Any], None]:
+    ) -> AsyncGenerator[ServerSentEvent, None]:
         """处理聊天请求，返回适当的响应类型
         
         Args:
-            request: FastAPI请求对象
+            request: FastAPI请求对象，为 None 时不检查客户端是否断开（如 WebSocket 由发送失败感知断开）
             handler: Agent或Workflow实例
             input: 聊天请求对象
             type: 处理类型，"agent"或"workflow"
         """
         # 提取用户消息
         user_message = SSEAdapter.extract_user_message(input)
-        logger.debug(f"Starting stream response for message: {user_message}")
+        logger.debug("Starting stream response for message: {}", user_message)
 
         # 根据type选择对应的处理方法
         if type == "agent":
             async_gen = await handler.arun(user_message, stream=input.stream)
 
-            async for chunk in async_gen:
-                if await request.is_disconnected():
-                    logger.warning("客户端已断开连接...")
-                    break
-
-                yield {
-                    "event": "stream",
-                    "data": json.dumps({"delta": chunk.content}, ensure_ascii=False),
-                }
+            async for chunk in _until_disconnected(request, async_gen):
+                yield ServerSentEvent(
+                    event="stream",
+                    data=_stream_data(chunk.content),
+                )
         else:
             response: AsyncIterator[WorkflowRunResponseEvent] = await handler.arun(message=user_message, stream=input.stream)
 
-            async for event in response:
-                if await request.is_disconnected():
-                    logger.warning("客户端已断开连接...")
-                    break
-
-                if event.event == RunResponseContentEvent.event:
+            async for event in _until_disconnected(request, response):
+                if event.event == CONTENT_EVENT:
                     if event.extra_data and "artifacts" in event.extra_data:
-                        for artifact in event.extra_data["artifacts"]:
-                            yield {
-                                "event": "artifact",
-                                "data": artifact.model_dump_json(),
-                            }
+                        # 同一事件的 artifact 由 pydantic-core 一次转换，再逐个发送（保持每个 artifact 一个事件）
+                        for artifact in _ARTIFACTS_ADAPTER.dump_python(event.extra_data["artifacts"], mode="json"):
+                            yield ServerSentEvent(
+                                event="artifact",
+                                data=dumps(artifact).decode(),
+                            )
                     else:
-                        yield {
-                            "event": "stream",
-                            "data": json.dumps({"delta": event.content}, ensure_ascii=False),
-                        }
+                        yield ServerSentEvent(
+                            event="stream",
+                            data=_stream_data(event.content),
+                        )
@@ -0,0 +1,94 @@
+import asyncio
+import os
+from functools import lru_cache
+from typing import AsyncIterator, List, Optional
+
+from loguru import logger
+
+
+@lru_cache(maxsize=1)
+def _get_batch_ms() -> float:
+    """
+    流式响应的合并窗口（毫秒），从环境变量 MINDMATRIX_SSE_BATCH_MS 读取
+
+    默认为 0，即不合并，每个事件单独发送
+    """
+    value = os.getenv("MINDMATRIX_SSE_BATCH_MS", "0")
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        logger.warning("invalid MINDMATRIX_SSE_BATCH_MS: {!r}, batching disabled", value)
+        return 0.0
+
+
+async def coalesce(
+    chunks: AsyncIterator[bytes],
+    max_ms: Optional[float] = None,
+    max_bytes: int = 4096,
+) -> AsyncIterator[bytes]:
+    """
+    将短时间内连续到达的 SSE 事件合并为一次写出
+
+    收到一个事件后，在 max_ms 毫秒内继续等待后续事件，直到超时或累计达到 max_bytes，
+    然后把这些完整的事件帧拼接后一次发送；窗口内只有一个事件时原样发送。
+    每次发送的都是完整的事件帧，不会在此缓存半个事件，下游无需拼接不完整的数据。
+
+    Args:
+        chunks: 完整 SSE 事件帧（以空行结尾）的异步迭代器
+        max_ms: 合并窗口（毫秒），默认读取 MINDMATRIX_SSE_BATCH_MS；不大于 0 时不合并
+        max_bytes: 单次写出的字节数上限
+    """
+    if max_ms is None:
+        max_ms = _get_batch_ms()
+    if max_ms <= 0:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    # 窗口超时时尚未完成的读取保留到下一轮，不能取消（取消会终止底层生成器）
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(anext(iterator))
+            try:
+                batch: List[bytes] = [await pending]
+            except StopAsyncIteration:
+                return
+            pending = None
+            assert batch[0].endswith(b"\n\n"), "SSE chunk must be a complete event frame"
+
+            size = len(batch[0])
+            deadline = loop.time() + max_ms / 1000
+            finished = False
+            while size < max_bytes:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                pending = asyncio.ensure_future(anext(iterator))
+                done, _ = await asyncio.wait((pending,), timeout=timeout)
+                if not done:
+                    break
+                pending = None
+                try:
+                    chunk = done.pop().result()
+                except StopAsyncIteration:
+                    finished = True
+                    break
+                assert chunk.endswith(b"\n\n"), "SSE chunk must be a complete event frame"
+                batch.append(chunk)
+                size += len(chunk)
+
+            yield batch[0] if len(batch) == 1 else b"".join(batch)
+            if finished:
+                return
+    finally:
+        # 提前结束（下游关闭或出错）时，等待取消完成后再关闭上游，避免遗留任务和未关闭的生成器
+        if pending is not None and not pending.done():
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()